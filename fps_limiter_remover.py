@@ -6,6 +6,7 @@ FPS限制器移除工具
 """
 
 import re
+import mmap
 from pathlib import Path
 
 class FPSLimiterRemover:
@@ -39,6 +40,10 @@ class FPSLimiterRemover:
                 "description": "优化异步睡眠时间"
             }
         ]
+        
+        # analyze_file 的预筛选：覆盖所有逐行检查的关键字，直接在字节上匹配，
+        # 文件中一处都没有时无需解码和逐行扫描
+        self.issue_prefilter = re.compile(rb"time\.sleep\(0\.01\)|time\.sleep\(0\.1\)|0\.016")
     
     def analyze_file(self, file_path):
         """分析文件中的性能限制"""
@@ -46,6 +51,14 @@ class FPSLimiterRemover:
             return None
             
         try:
+            if file_path.stat().st_size == 0:
+                return []
+            
+            # 通过mmap零拷贝预筛选，绝大多数无问题的文件到此即可返回
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if not self.issue_prefilter.search(mm):
+                    return []
+            
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
             
@@ -9,9 +9,13 @@ import time
 import threading
 import queue
 import heapq
+import logging
 from typing import Dict, List, Optional, Tuple
 import numpy as np
 
+# 热路径上的丢帧提示走 logging（默认不输出），避免逐帧 print 抢占 GIL 和 stdout 锁
+logger = logging.getLogger(__name__)
+
 class FrameOrderingManager:
     """帧时间顺序管理器"""
     
@@ -29,6 +33,8 @@ class FrameOrderingManager:
         # 使用优先队列（最小堆）按时间戳排序
         self.frame_heap = []  # 存储 (-timestamp, frame_id, frame_data)
         self.heap_lock = threading.Lock()
+        # 堆中最旧帧的时间戳（最新帧即堆顶），随增删增量维护，避免状态查询时扫描整个堆
+        self._oldest_timestamp = 0.0
         
         # 帧ID计数器
         self.frame_counter = 0
@@ -48,24 +54,25 @@ class FrameOrderingManager:
         print(f"   • 最大帧年龄: {max_frame_age*1000:.1f}ms")
         print(f"   • 缓冲区大小: {buffer_size}")
     
-    def add_frame(self, frame_data: Dict) -> bool:
+    def add_frame(self, frame_data: Dict, frame_timestamp: float) -> bool:
         """
         添加帧到有序缓冲区
         
         Args:
-            frame_data: 包含frame和timestamp的字典
+            frame_data: 帧数据字典
+            frame_timestamp: 截图时刻的时间戳（time.time()），由生产者提供
             
         Returns:
             是否成功添加
         """
         current_time = time.time()
-        frame_timestamp = frame_data.get('timestamp', current_time)
         
         # 检查帧是否过时
         frame_age = current_time - frame_timestamp
         if frame_age > self.max_frame_age:
             self.stats['frames_discarded_old'] += 1
-            print(f"[WARNING] 丢弃过时帧: 年龄 {frame_age*1000:.1f}ms > {self.max_frame_age*1000:.1f}ms")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"丢弃过时帧: 年龄 {frame_age*1000:.1f}ms > {self.max_frame_age*1000:.1f}ms")
             return False
         
         with self.counter_lock:
@@ -79,10 +86,13 @@ class FrameOrderingManager:
                 if self.frame_heap:
                     removed_frame = heapq.heappop(self.frame_heap)
                     self.stats['frames_discarded_overflow'] += 1
-                    print(f"[INFO] 缓冲区满，丢弃旧帧: ID {removed_frame[1]}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"缓冲区满，丢弃旧帧: ID {removed_frame[1]}")
             
             # 添加新帧（使用负时间戳使最新帧在堆顶）
             heapq.heappush(self.frame_heap, (-frame_timestamp, frame_id, frame_data))
+            if len(self.frame_heap) == 1 or frame_timestamp < self._oldest_timestamp:
+                self._oldest_timestamp = frame_timestamp
             self.stats['frames_received'] += 1
             self.stats['latest_timestamp'] = max(self.stats['latest_timestamp'], frame_timestamp)
         
@@ -109,7 +119,8 @@ class FrameOrderingManager:
             
             if frame_age > self.max_frame_age:
                 self.stats['frames_discarded_old'] += 1
-                print(f"[WARNING] 获取时发现过时帧: 年龄 {frame_age*1000:.1f}ms")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"获取时发现过时帧: 年龄 {frame_age*1000:.1f}ms")
                 return self.get_latest_frame()  # 递归获取下一个帧
             
             self.stats['frames_processed'] += 1
@@ -143,6 +154,7 @@ class FrameOrderingManager:
                 
                 if frame_age <= self.max_frame_age:
                     temp_frames.append((neg_timestamp, frame_id, frame_data))
+                    self._oldest_timestamp = timestamp  # 弹出顺序由新到旧，最后保留的即最旧
                 else:
                     self.stats['frames_discarded_old'] += 1
             
@@ -175,6 +187,7 @@ class FrameOrderingManager:
                 
                 if frame_age <= self.max_frame_age:
                     valid_frames.append((neg_timestamp, frame_id, frame_data))
+                    self._oldest_timestamp = timestamp  # 弹出顺序由新到旧，最后保留的即最旧
                 else:
                     self.stats['frames_discarded_old'] += 1
             
@@ -188,11 +201,8 @@ class FrameOrderingManager:
             buffer_size = len(self.frame_heap)
             
             if buffer_size > 0:
-                # 计算时间范围
-                timestamps = [-item[0] for item in self.frame_heap]
-                oldest_timestamp = min(timestamps)
-                newest_timestamp = max(timestamps)
-                time_span = newest_timestamp - oldest_timestamp
+                # 堆顶即最新帧，最旧帧时间戳在增删时已维护好，O(1) 得到时间跨度
+                time_span = -self.frame_heap[0][0] - self._oldest_timestamp
             else:
                 time_span = 0.0
         
@@ -274,17 +284,18 @@ class EnhancedMultiThreadProcessor:
                 print(f"[ERROR] 帧清理线程错误: {e}")
                 time.sleep(0.1)
     
-    def process_frame(self, frame_data: Dict) -> bool:
+    def process_frame(self, frame_data: Dict, frame_timestamp: float) -> bool:
         """
         处理帧
         
         Args:
             frame_data: 帧数据
+            frame_timestamp: 截图时刻的时间戳（time.time()）
             
         Returns:
             是否成功处理
         """
-        return self.frame_manager.add_frame(frame_data)
+        return self.frame_manager.add_frame(frame_data, frame_timestamp)
     
     def get_latest_frame(self) -> Optional[Dict]:
         """获取最新帧"""
@@ -317,7 +328,7 @@ def test_frame_ordering():
     
     print("添加测试帧...")
     for i, frame_data in enumerate(test_frames):
-        success = manager.add_frame(frame_data)
+        success = manager.add_frame(frame_data, frame_data['timestamp'])
         print(f"帧 {i+1} ({frame_data['source']}): {'成功' if success else '失败'}")
     
     print("\n获取帧（按时间顺序）...")
@@ -10,11 +10,31 @@ import time
 import ctypes
 from ctypes import wintypes
 
-# 添加mouse_driver路径
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'mouse_driver'))
+# 添加mouse_driver路径（已存在时不再重复插入）
+MOUSE_DRIVER_PATH = os.path.join(os.path.dirname(__file__), 'mouse_driver')
+if MOUSE_DRIVER_PATH not in sys.path:
+    sys.path.insert(0, MOUSE_DRIVER_PATH)
 
-def reload_mouse_driver():
-    """重新加载鼠标驱动模块"""
+# Logitech USB设备在注册表中的枚举位置和厂商ID前缀
+LOGITECH_USB_ENUM_KEY = r"SYSTEM\CurrentControlSet\Enum\USB"
+LOGITECH_VENDOR_PREFIX = "VID_046D&"
+
+# 最近一次成功加载的驱动模块，供重连/测试流程复用
+_loaded_driver = None
+
+def reload_mouse_driver(force=False):
+    """
+    重新加载鼠标驱动模块
+    
+    Args:
+        force: 为True时清除sys.modules中的驱动模块并重新导入；
+               否则优先复用上一次成功加载的结果
+    """
+    global _loaded_driver
+    
+    if _loaded_driver is not None and not force:
+        return _loaded_driver
+    
     print("🔄 重新加载鼠标驱动模块...")
     
     # 清除已导入的模块
@@ -32,9 +52,11 @@ def reload_mouse_driver():
         import MouseMove
         from ReliableMouseMove import get_driver, get_driver_status, mouse_move, get_cursor_position
         print("✓ 驱动模块重新加载成功")
-        return True, MouseMove, get_driver, get_driver_status, mouse_move, get_cursor_position
+        _loaded_driver = (True, MouseMove, get_driver, get_driver_status, mouse_move, get_cursor_position)
+        return _loaded_driver
     except Exception as e:
         print(f"✗ 驱动模块重新加载失败: {e}")
+        _loaded_driver = None
         return False, None, None, None, None, None
 
 def check_g304_specific():
@@ -45,9 +67,11 @@ def check_g304_specific():
     # 检查G-Hub进程
     import psutil
     ghub_processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+    # 只请求 pid/name，cmdline 需要逐进程额外读取且这里用不到
+    for proc in psutil.process_iter(['pid', 'name']):
         try:
-            if 'lghub' in proc.info['name'].lower():
+            name = proc.info['name']
+            if name and 'lghub' in name.lower():
                 ghub_processes.append(proc.info)
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             continue
@@ -59,18 +83,51 @@ def check_g304_specific():
     # 检查USB设备（G304是无线的，但接收器是USB）
     print("\n检查USB设备连接...")
     try:
-        import subprocess
-        result = subprocess.run(['powershell', '-Command', 
-                               'Get-WmiObject -Class Win32_USBHub | Where-Object {$_.Description -like "*Logitech*"} | Select-Object Description, DeviceID'],
-                               capture_output=True, text=True, timeout=10)
-        if result.stdout:
+        logitech_devices = find_logitech_usb_devices()
+        if logitech_devices:
             print("找到Logitech USB设备:")
-            print(result.stdout)
+            for description, device_id in logitech_devices:
+                print(f"  - {description} ({device_id})")
         else:
             print("⚠️  没有找到Logitech USB设备")
     except Exception as e:
         print(f"USB设备检查失败: {e}")
 
+def find_logitech_usb_devices():
+    """
+    直接读取注册表中的USB设备枚举项，查找Logitech（VID_046D）设备
+    
+    比起启动 PowerShell 查询 WMI（进程启动 + .NET 初始化约数百毫秒），
+    读取注册表只需几毫秒
+    
+    Returns:
+        [(设备描述, 设备ID), ...]
+    """
+    import winreg
+    
+    devices = []
+    with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, LOGITECH_USB_ENUM_KEY) as usb_key:
+        subkey_count = winreg.QueryInfoKey(usb_key)[0]
+        for i in range(subkey_count):
+            hardware_id = winreg.EnumKey(usb_key, i)
+            if not hardware_id.upper().startswith(LOGITECH_VENDOR_PREFIX):
+                continue
+            
+            with winreg.OpenKey(usb_key, hardware_id) as hardware_key:
+                instance_count = winreg.QueryInfoKey(hardware_key)[0]
+                for j in range(instance_count):
+                    instance_id = winreg.EnumKey(hardware_key, j)
+                    try:
+                        with winreg.OpenKey(hardware_key, instance_id) as instance_key:
+                            description = winreg.QueryValueEx(instance_key, 'DeviceDesc')[0]
+                    except OSError:
+                        description = 'N/A'
+                    # DeviceDesc 形如 "@input.inf,%hid.devicedesc%;USB Input Device"
+                    description = description.rsplit(';', 1)[-1]
+                    devices.append((description, f"USB\\{hardware_id}\\{instance_id}"))
+    
+    return devices
+
 def force_reconnect_g304():
     """强制重新连接G304"""
     print("\n🔄 强制重新连接G304...")
@@ -136,8 +193,12 @@ def test_g304_movement():
         print(f"  {desc}: 移动前({before_x}, {before_y})", end=" -> ")
         
         if mouse_move(dx, dy):
-            time.sleep(0.2)
+            # 轮询光标位置，一旦发生变化立即结束等待，最多等待0.2秒
+            deadline = time.perf_counter() + 0.2
             after_x, after_y = get_cursor_position()
+            while (after_x, after_y) == (before_x, before_y) and time.perf_counter() < deadline:
+                time.sleep(0.005)
+                after_x, after_y = get_cursor_position()
             actual_dx = after_x - before_x
             actual_dy = after_y - before_y
             print(f"移动后({after_x}, {after_y}), 实际移动({actual_dx}, {actual_dy})")
@@ -200,7 +261,7 @@ def main():
             check_g304_specific()
             
         elif choice == '2':
-            reload_mouse_driver()
+            reload_mouse_driver(force=True)
             
         elif choice == '3':
             force_reconnect_g304()
@@ -1,10 +1,20 @@
 import pygetwindow
+import re
 import time
 import bettercam
+import cv2
+import ctypes
 import sys
+import threading
+import numpy as np
 import os
+import logging
+from functools import lru_cache
 from typing import Union
 
+# 截图热路径上的错误走 logging（参数延迟格式化），避免逐帧 print 抢占 GIL 和 stdout 锁
+logger = logging.getLogger(__name__)
+
 # Could be do with
 # from config import *
 # But we are writing it out for clarity for new devs
@@ -27,28 +37,240 @@ except ImportError:
     DXCAM_AVAILABLE = False
     print("[WARNING] dxcam 不可用，如果 bettercam 失败将无法使用备选方案")
 
+# mss 作为最终备选方案
+try:
+    import mss
+    MSS_AVAILABLE = True
+except ImportError:
+    MSS_AVAILABLE = False
+
+@lru_cache(maxsize=8)
+def _cached_capture_region(left: int, top: int, width: int, height: int, capture_size: int) -> tuple:
+    """
+    缓存增强检测配置计算出的截取区域，窗口切换/重连重试时不再重复计算和打印。
+    capture_size 参与缓存键，增强倍数更新后会重新计算。
+    """
+    return get_enhanced_detection_config().get_capture_region(left, top, width, height)
+
+# 截图目标帧率上限；实际使用时不超过显示器刷新率（高于刷新率只会截到重复帧）
+TARGET_CAPTURE_FPS = 351
+VREFRESH = 116  # GetDeviceCaps 索引：当前显示器垂直刷新率
+# 截图后端环形缓冲区帧数：消费者始终只取最新帧，几帧足以覆盖生产/消费之间的抖动
+# （后端默认的数帧缓冲正是按常规消费节奏设计的），512帧只会白白占用上百MB内存
+CAPTURE_BUFFER_LEN = 4
+
+# 游戏窗口激活重试参数（秒）
+ACTIVATION_TIMEOUT = 90.0
+ACTIVATION_INITIAL_DELAY = 0.1
+ACTIVATION_MAX_DELAY = 2.0
+
+# Check if running in GUI mode
+# Multiple ways to detect GUI mode:
+# 1. Environment variable set by GUI
+# 2. Check if stdin is not a tty
+# 3. Check if autoSelectWindow is enabled (fallback)
+# 进程运行期间都不会改变，模块加载时计算一次
+_IS_GUI_MODE = (
+    os.environ.get('AIMBOT_GUI_MODE') == '1' or
+    sys.stdin is None or not sys.stdin.isatty() or
+    autoSelectWindow
+)
+
+def get_monitor_refresh_rate() -> Union[int, None]:
+    """获取主显示器刷新率（Hz），无法获取时返回None"""
+    try:
+        user32 = ctypes.windll.user32
+        hdc = user32.GetDC(0)
+        try:
+            refresh_rate = ctypes.windll.gdi32.GetDeviceCaps(hdc, VREFRESH)
+        finally:
+            user32.ReleaseDC(0, hdc)
+        # 0/1 表示驱动使用默认刷新率，视为未知
+        return refresh_rate if refresh_rate > 1 else None
+    except Exception:
+        return None
+
+def get_capture_fps(target_fps: int = TARGET_CAPTURE_FPS) -> int:
+    """截图帧率：限制在显示器刷新率（留少量余量应对帧间抖动）以内"""
+    refresh_rate = get_monitor_refresh_rate()
+    if refresh_rate is None:
+        return target_fps
+    return min(target_fps, refresh_rate + 5)
+
+def center_capture_region(region: tuple, size: int = 320) -> tuple:
+    """
+    在源区域中居中取 size x size 的子区域（源区域不足时取源实际尺寸），
+    直接作为截图后端的 region，省去逐帧的中心裁剪。
+    """
+    src_left, src_top, src_right, src_bottom = region
+    src_w = max(0, src_right - src_left)
+    src_h = max(0, src_bottom - src_top)
+    left = src_left + max((src_w - size) // 2, 0)
+    top = src_top + max((src_h - size) // 2, 0)
+    return (left, top, left + min(src_w, size), top + min(src_h, size))
+
+# BetterCam包装器，解决is_capturing属性缺失问题
+class BetterCamWrapper:
+    def __init__(self, region):
+        # 截图区域在源头直接定为中心 320x320，后端输出即为最终帧
+        self.region = center_capture_region(region)
+        left, top, right, bottom = self.region
+        self._needs_resize = (right - left, bottom - top) != (320, 320)
+        self.is_capturing = False
+        self._camera = None
+
+    def _resize_to_320(self, frame):
+        """源区域不足 320x320 时（极少见）一次性缩放到 320x320"""
+        return cv2.resize(frame, (320, 320), interpolation=cv2.INTER_AREA)
+
+    def start(self, fps=60, video_mode=True):
+        try:
+            # 下游只用前三个通道（shape[2] == 4 时才去掉alpha），直接输出BGR省去25%的带宽
+            self._camera = bettercam.create(region=self.region, output_color="BGR", max_buffer_len=CAPTURE_BUFFER_LEN)
+            if self._camera is not None:
+                self._camera.start(fps, video_mode=video_mode)
+                self.is_capturing = True
+                print("[SUCCESS] 使用 bettercam 进行屏幕捕获")
+                return True
+            else:
+                raise Exception("bettercam.create() 返回 None")
+        except Exception as e:
+            print(f"[ERROR] BetterCam启动失败: {e}")
+            self.is_capturing = False
+            return False
+
+    def get_latest_frame(self):
+        if not self.is_capturing or self._camera is None:
+            return None
+        try:
+            frame = self._camera.get_latest_frame()
+            if frame is None or not self._needs_resize:
+                return frame
+            return self._resize_to_320(frame)
+        except Exception as e:
+            logger.warning("BetterCam获取帧失败: %s", e)
+            return None
+
+    def stop(self):
+        self.is_capturing = False
+        if self._camera is not None:
+            try:
+                # 避免调用有问题的stop方法，直接设置为None
+                self._camera = None
+            except Exception as e:
+                print(f"[DEBUG] BetterCam停止时出现错误: {e}")
+                self._camera = None
+
+    def release(self):
+        self.stop()
+
+# 包装 dxcam，确保输出统一为 320x320
+class DXCamWrapper:
+    def __init__(self, cam, region):
+        self._camera = cam
+        left, top, right, bottom = region
+        self._needs_resize = (right - left, bottom - top) != (320, 320)
+        self.is_capturing = True
+
+    def _resize_to_320(self, frame):
+        """源区域不足 320x320 时（极少见）一次性缩放到 320x320"""
+        return cv2.resize(frame, (320, 320), interpolation=cv2.INTER_AREA)
+
+    def start(self, fps=351, video_mode=True):
+        # 已在内部相机启动
+        self.is_capturing = True
+        return True
+
+    def get_latest_frame(self):
+        if not self.is_capturing or self._camera is None:
+            return None
+        try:
+            frame = self._camera.get_latest_frame()
+            if frame is None or not self._needs_resize:
+                return frame
+            return self._resize_to_320(frame)
+        except Exception as e:
+            logger.warning("dxcam获取帧失败: %s", e)
+            return None
+
+    def stop(self):
+        self.is_capturing = False
+        try:
+            self._camera.stop()
+        except:
+            pass
+
+    def release(self):
+        self.stop()
+
+# 简单的mss包装器，模拟camera接口
+class MSSCamera:
+    def __init__(self, region):
+        # 将 mss 捕获区域直接约束为中心 320x320（源头定幅）
+        # 如果源区域小于 320 则取源实际尺寸，后续再做一次性缩放
+        left, top, right, bottom = center_capture_region(region)
+        self.region = {"top": top, "left": left, "width": right - left, "height": bottom - top}
+        # 正常显示器上区域恒为 320x320，只有源区域不足时才走缩放分支
+        self._needs_resize = (self.region["width"], self.region["height"]) != (320, 320)
+        self.is_capturing = False
+        # 使用线程本地存储来避免线程安全问题
+        self._local = threading.local()
+
+    def _get_sct(self):
+        """获取线程本地的mss实例"""
+        if not hasattr(self._local, 'sct'):
+            self._local.sct = mss.mss()
+        return self._local.sct
+
+    def start(self, fps=60, video_mode=True):
+        self.is_capturing = True
+        print(f"[SUCCESS] 使用 mss 进行屏幕捕获，区域: {self.region}")
+
+    def get_latest_frame(self):
+        if not self.is_capturing:
+            return None
+        try:
+            # 每次都获取线程本地的mss实例
+            sct = self._get_sct()
+            screenshot = sct.grab(self.region)
+            # 以 np.frombuffer 零拷贝地把 mss 的原始BGRA字节视为数组
+            # 该数组与 screenshot.raw 共享内存；mss 每次 grab 都会分配新的 raw，
+            # 因此返回的帧不会被下一次截图覆盖，也可以原地写入（如遮罩）
+            frame = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+            if not self._needs_resize:
+                return frame
+            # 源区域不足 320 时一次性缩放到 320x320
+            return cv2.resize(frame, (320, 320), interpolation=cv2.INTER_AREA)
+        except Exception as e:
+            logger.warning("mss截图失败: %s", e)
+            return None
+
+    def stop(self):
+        self.is_capturing = False
+        # 清理线程本地的mss实例
+        if hasattr(self._local, 'sct'):
+            try:
+                self._local.sct.close()
+            except:
+                pass
+            delattr(self._local, 'sct')
+
+    def release(self):
+        self.stop()
+
 def gameSelection() -> Union[tuple, None]:
     # Selecting the correct game window
     try:
         videoGameWindows = pygetwindow.getAllWindows()
         print("=== All Windows ===")
         for index, window in enumerate(videoGameWindows):
+            # window.title 每次访问都会调用 GetWindowTextW，只读取一次
+            title = window.title
             # only output the window if it has a meaningful title
-            if window.title != "":
-                print("[{}]: {}".format(index, window.title))
-        
-        # Check if running in GUI mode
-        # Multiple ways to detect GUI mode:
-        # 1. Environment variable set by GUI
-        # 2. Check if stdin is not a tty
-        # 3. Check if autoSelectWindow is enabled (fallback)
-        is_gui_mode = (
-            os.environ.get('AIMBOT_GUI_MODE') == '1' or
-            not sys.stdin.isatty() or
-            autoSelectWindow
-        )
+            if title != "":
+                print("[{}]: {}".format(index, title))
         
-        if is_gui_mode and autoSelectWindow:
+        if _IS_GUI_MODE and autoSelectWindow:
             # Auto-select game window in GUI mode
             print("[AUTO] GUI模式检测到，正在自动选择游戏窗口...")
             videoGameWindow = auto_select_game_window(videoGameWindows)
@@ -74,9 +296,12 @@ def gameSelection() -> Union[tuple, None]:
         return None
 
     # Activate that Window
-    activationRetries = 30
+    # 指数退避重试（0.1s 起翻倍，最长 2s），总等待时间仍与原先 30 x 3s 相同，
+    # 用户切回游戏后能更快激活成功
+    activationDeadline = time.monotonic() + ACTIVATION_TIMEOUT
+    activationDelay = ACTIVATION_INITIAL_DELAY
     activationSuccess = False
-    while (activationRetries > 0):
+    while True:
         try:
             videoGameWindow.activate()
             activationSuccess = True
@@ -88,11 +313,13 @@ def gameSelection() -> Union[tuple, None]:
             print("Failed to activate game window: {}".format(str(e)))
             print("Read the relevant restrictions here: https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-setforegroundwindow")
             activationSuccess = False
-            activationRetries = 0
             break
         # wait a little bit before the next try
-        time.sleep(3.0)
-        activationRetries = activationRetries - 1
+        remaining = activationDeadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(activationDelay, remaining))
+        activationDelay = min(activationDelay * 2, ACTIVATION_MAX_DELAY)
     # if we failed to activate the window then we'll be unable to send input to it
     # so just exit the script now
     if activationSuccess == False:
@@ -102,11 +329,12 @@ def gameSelection() -> Union[tuple, None]:
     # 使用增强检测配置计算截取区域
     if ENHANCED_DETECTION_AVAILABLE:
         enhanced_config = get_enhanced_detection_config()
-        left, top, right, bottom = enhanced_config.get_capture_region(
+        left, top, right, bottom = _cached_capture_region(
             videoGameWindow.left, 
             videoGameWindow.top, 
             videoGameWindow.width, 
-            videoGameWindow.height
+            videoGameWindow.height,
+            enhanced_config.CAPTURE_SIZE
         )
         
         # 更新截取区域尺寸
@@ -133,6 +361,9 @@ def gameSelection() -> Union[tuple, None]:
 
     print(region)
 
+    capture_fps = get_capture_fps()
+    print(f"[INFO] 截图帧率: {capture_fps} FPS")
+
     # Try bettercam first
     camera = None
     camera_type = "bettercam"
@@ -141,84 +372,8 @@ def gameSelection() -> Union[tuple, None]:
         print(f"[DEBUG] 尝试创建bettercam，region: {region}")
         # 确保region参数正确
         if len(region) == 4 and all(isinstance(x, int) for x in region):
-            # 先尝试创建默认实例，然后删除重新创建带region的实例
-            try:
-                temp_camera = bettercam.create()
-                if temp_camera:
-                    del temp_camera  # 删除默认实例
-                    print("[DEBUG] 已清理默认bettercam实例")
-            except:
-                pass
-            
-            # 创建BetterCam包装器来解决is_capturing属性缺失问题（保持在try内部，修正缩进）
-            class BetterCamWrapper:
-                def __init__(self, region):
-                    self.region = region
-                    self.is_capturing = False
-                    self._camera = None
-
-                def _center_crop_320(self, frame):
-                    """
-                    将输入帧中心裁剪为 320x320（若帧尺寸更大），避免下游缩放开销。
-                    当帧尺寸小于 320x320 时，使用 INTER_AREA 进行一次性缩放。
-                    """
-                    try:
-                        import numpy as np
-                        h, w = frame.shape[:2]
-                        if h == 320 and w == 320:
-                            return frame
-                        if h >= 320 and w >= 320:
-                            y0 = (h - 320) // 2
-                            x0 = (w - 320) // 2
-                            return frame[y0:y0+320, x0:x0+320, :]
-                        # 小于目标尺寸时降采样到 320x320
-                        import cv2
-                        return cv2.resize(frame, (320, 320), interpolation=cv2.INTER_AREA)
-                    except Exception:
-                        return frame
-
-                def start(self, fps=60, video_mode=True):
-                    try:
-                        self._camera = bettercam.create(region=self.region, output_color="BGRA", max_buffer_len=512)
-                        if self._camera is not None:
-                            self._camera.start(fps, video_mode=video_mode)
-                            self.is_capturing = True
-                            print("[SUCCESS] 使用 bettercam 进行屏幕捕获")
-                            return True
-                        else:
-                            raise Exception("bettercam.create() 返回 None")
-                    except Exception as e:
-                        print(f"[ERROR] BetterCam启动失败: {e}")
-                        self.is_capturing = False
-                        return False
-
-                def get_latest_frame(self):
-                    if not self.is_capturing or self._camera is None:
-                        return None
-                    try:
-                        frame = self._camera.get_latest_frame()
-                        if frame is None:
-                            return None
-                        return self._center_crop_320(frame)
-                    except Exception as e:
-                        print(f"[ERROR] BetterCam获取帧失败: {e}")
-                        return None
-
-                def stop(self):
-                    self.is_capturing = False
-                    if self._camera is not None:
-                        try:
-                            # 避免调用有问题的stop方法，直接设置为None
-                            self._camera = None
-                        except Exception as e:
-                            print(f"[DEBUG] BetterCam停止时出现错误: {e}")
-                            self._camera = None
-
-                def release(self):
-                    self.stop()
-
             camera = BetterCamWrapper(region)
-            if not camera.start(351, video_mode=True):
+            if not camera.start(capture_fps, video_mode=True):
                 raise Exception("BetterCam包装器启动失败")
         else:
             raise Exception(f"region参数格式错误: {region}")
@@ -242,69 +397,12 @@ def gameSelection() -> Union[tuple, None]:
                 except:
                     print("[DEBUG] 无法检查GPU内存状态")
                 
-                # 先尝试创建默认实例，然后删除重新创建带region的实例
-                try:
-                    temp_camera = dxcam.create()
-                    if temp_camera:
-                        temp_camera.release()
-                        del temp_camera
-                        print("[DEBUG] 已清理默认dxcam实例")
-                except:
-                    pass
-                
-                inner_cam = dxcam.create(device_idx=0, region=region, max_buffer_len=512)
+                # 与 bettercam 相同，直接在源头截取中心 320x320
+                dxcam_region = center_capture_region(region)
+                inner_cam = dxcam.create(device_idx=0, region=dxcam_region, output_color="BGR", max_buffer_len=CAPTURE_BUFFER_LEN)
                 if inner_cam is not None:
-                    inner_cam.start(351, video_mode=True)
-                    # 包装 dxcam，确保输出统一为 320x320
-                    class DXCamWrapper:
-                        def __init__(self, cam):
-                            self._camera = cam
-                            self.is_capturing = True
-                        
-                        def _center_crop_320(self, frame):
-                            """
-                            将输入帧中心裁剪为 320x320（若帧尺寸更大），不足则一次性缩放。
-                            """
-                            try:
-                                h, w = frame.shape[:2]
-                                if h == 320 and w == 320:
-                                    return frame
-                                if h >= 320 and w >= 320:
-                                    y0 = (h - 320) // 2
-                                    x0 = (w - 320) // 2
-                                    return frame[y0:y0+320, x0:x0+320, :]
-                                import cv2
-                                return cv2.resize(frame, (320, 320), interpolation=cv2.INTER_AREA)
-                            except Exception:
-                                return frame
-                        
-                        def start(self, fps=351, video_mode=True):
-                            # 已在内部相机启动
-                            self.is_capturing = True
-                            return True
-                        
-                        def get_latest_frame(self):
-                            if not self.is_capturing or self._camera is None:
-                                return None
-                            try:
-                                frame = self._camera.get_latest_frame()
-                                if frame is None:
-                                    return None
-                                return self._center_crop_320(frame)
-                            except Exception as e:
-                                print(f"[ERROR] dxcam获取帧失败: {e}")
-                                return None
-                        
-                        def stop(self):
-                            self.is_capturing = False
-                            try:
-                                self._camera.stop()
-                            except:
-                                pass
-                        
-                        def release(self):
-                            self.stop()
-                    camera = DXCamWrapper(inner_cam)
+                    inner_cam.start(capture_fps, video_mode=True)
+                    camera = DXCamWrapper(inner_cam, dxcam_region)
                     camera_type = "dxcam"
                     print("[SUCCESS] 使用 dxcam 进行屏幕捕获（统一输出 320x320）")
                 else:
@@ -320,75 +418,10 @@ def gameSelection() -> Union[tuple, None]:
     if camera is None:
         print("[INFO] 尝试使用 mss 作为最终备选方案...")
         try:
-            import mss
-            # 创建一个简单的mss包装器来模拟camera接口
-            class MSSCamera:
-                def __init__(self, region):
-                    # 将 mss 捕获区域直接约束为中心 320x320（源头定幅）
-                    src_left, src_top, src_right, src_bottom = region
-                    src_w = max(0, src_right - src_left)
-                    src_h = max(0, src_bottom - src_top)
-                    cap_w = 320
-                    cap_h = 320
-                    # 居中取 320x320，如果源区域小于 320 则取源实际尺寸，后续再做一次性缩放
-                    left = src_left + max((src_w - cap_w) // 2, 0)
-                    top = src_top + max((src_h - cap_h) // 2, 0)
-                    actual_w = cap_w if src_w >= cap_w else src_w
-                    actual_h = cap_h if src_h >= cap_h else src_h
-                    self.region = {"top": top, "left": left, "width": actual_w, "height": actual_h}
-                    self.is_capturing = False
-                    # 使用线程本地存储来避免线程安全问题
-                    import threading
-                    self._local = threading.local()
-                
-                def _get_sct(self):
-                    """获取线程本地的mss实例"""
-                    if not hasattr(self._local, 'sct'):
-                        self._local.sct = mss.mss()
-                    return self._local.sct
-                
-                def start(self, fps=60, video_mode=True):
-                    self.is_capturing = True
-                    print(f"[SUCCESS] 使用 mss 进行屏幕捕获，区域: {self.region}")
-                
-                def get_latest_frame(self):
-                    if not self.is_capturing:
-                        return None
-                    try:
-                        # 每次都获取线程本地的mss实例
-                        sct = self._get_sct()
-                        screenshot = sct.grab(self.region)
-                        # 转换为numpy数组，格式为BGRA
-                        import numpy as np
-                        frame = np.array(screenshot)
-                        # 若源区域不足 320，则做一次性缩放到 320x320；否则直接返回
-                        try:
-                            h, w = frame.shape[:2]
-                            if h == 320 and w == 320:
-                                return frame
-                            import cv2
-                            return cv2.resize(frame, (320, 320), interpolation=cv2.INTER_AREA)
-                        except Exception:
-                            return frame
-                    except Exception as e:
-                        print(f"[ERROR] mss截图失败: {e}")
-                        return None
-                
-                def stop(self):
-                    self.is_capturing = False
-                    # 清理线程本地的mss实例
-                    if hasattr(self._local, 'sct'):
-                        try:
-                            self._local.sct.close()
-                        except:
-                            pass
-                        delattr(self._local, 'sct')
-                
-                def release(self):
-                    self.stop()
-            
+            if not MSS_AVAILABLE:
+                raise ImportError("mss 不可用")
             camera = MSSCamera(region)
-            camera.start(351, video_mode=True)
+            camera.start(capture_fps, video_mode=True)
             camera_type = "mss"
             
         except Exception as mss_error:
@@ -406,64 +439,77 @@ def gameSelection() -> Union[tuple, None]:
 
     return camera, cWidth, cHeight, camera_type, videoGameWindow, region
 
+# 常见游戏窗口关键词（按优先级排序）
+GAME_KEYWORDS = [
+    # FPS游戏
+    "VALORANT", "Counter-Strike", "CS:GO", "CS2", "Apex Legends", 
+    "Call of Duty", "Overwatch", "Rainbow Six", "Battlefield",
+    # 其他游戏
+    "Fortnite", "PUBG", "Warzone", "Destiny", "Halo", "Titanfall",
+    "Rust", "Escape from Tarkov", "Hunt: Showdown", "Paladins",
+    # 中文游戏
+    "无畏契约", "穿越火线", "和平精英", "绝地求生"
+]
+
+# 添加自定义游戏关键词
+if customGameKeywords:
+    GAME_KEYWORDS = customGameKeywords + GAME_KEYWORDS
+
+# 排除的窗口关键词
+EXCLUDE_KEYWORDS = [
+    "AI-Aimbot", "Trae", "Visual Studio", "PyCharm", "Notepad",
+    "Explorer", "Chrome", "Firefox", "Edge", "Discord", "QQ", "WeChat",
+    "Steam", "Epic Games", "Battle.net", "Origin", "Uplay", "WeGame",
+    "Task Manager", "Control Panel", "Settings", "Program Manager",
+    "Windows", "Microsoft", "输入体验"
+]
+
+# 关键词预编译为单个正则，每个窗口标题只扫描一次。
+# 游戏关键词每个占一个分组（分组序号即优先级），放在前瞻里以便找出标题中所有位置的匹配，
+# 同一位置有多个关键词时按书写顺序优先取优先级高的
+_GAME_KEYWORD_RE = re.compile(
+    "(?=(?:" + "|".join("({})".format(re.escape(k)) for k in GAME_KEYWORDS) + "))",
+    re.IGNORECASE
+)
+_EXCLUDE_KEYWORD_RE = re.compile("|".join(re.escape(k) for k in EXCLUDE_KEYWORDS), re.IGNORECASE)
+
+def _game_keyword_priority(title: str) -> Union[int, None]:
+    """返回标题中命中的最高优先级游戏关键词序号，未命中返回None"""
+    return min((m.lastindex for m in _GAME_KEYWORD_RE.finditer(title)), default=None)
+
 def auto_select_game_window(windows):
     """自动选择游戏窗口"""
+    # 每个窗口只读取一次标题（window.title 每次访问都会调用 GetWindowTextW），后续都基于该列表
+    titled_windows = [(window, title) for window, title in ((w, w.title) for w in windows) if title]
+    
     # 首先检查是否有指定的首选窗口
     if preferredWindowTitle:
         print("[INFO] 搜索指定窗口: {}".format(preferredWindowTitle))
-        for window in windows:
-            if preferredWindowTitle.lower() in window.title.lower():
-                print("[SUCCESS] 找到指定窗口: {}".format(window.title))
+        preferred_title = preferredWindowTitle.lower()
+        for window, title in titled_windows:
+            if preferred_title in title.lower():
+                print("[SUCCESS] 找到指定窗口: {}".format(title))
                 return window
         print("[WARNING] 未找到指定窗口，使用自动检测...")
     
-    # 常见游戏窗口关键词（按优先级排序）
-    game_keywords = [
-        # FPS游戏
-        "VALORANT", "Counter-Strike", "CS:GO", "CS2", "Apex Legends", 
-        "Call of Duty", "Overwatch", "Rainbow Six", "Battlefield",
-        # 其他游戏
-        "Fortnite", "PUBG", "Warzone", "Destiny", "Halo", "Titanfall",
-        "Rust", "Escape from Tarkov", "Hunt: Showdown", "Paladins",
-        # 中文游戏
-        "无畏契约", "穿越火线", "和平精英", "绝地求生"
-    ]
-    
-    # 添加自定义游戏关键词
-    if customGameKeywords:
-        game_keywords = customGameKeywords + game_keywords
-    
-    # 排除的窗口关键词
-    exclude_keywords = [
-        "AI-Aimbot", "Trae", "Visual Studio", "PyCharm", "Notepad",
-        "Explorer", "Chrome", "Firefox", "Edge", "Discord", "QQ", "WeChat",
-        "Steam", "Epic Games", "Battle.net", "Origin", "Uplay", "WeGame",
-        "Task Manager", "Control Panel", "Settings", "Program Manager",
-        "Windows", "Microsoft", "输入体验"
-    ]
-    
     valid_windows = []
+    best_window = None
+    best_priority = None
     
-    # 过滤有效窗口
-    for window in windows:
-        if window.title == "":
+    # 单次遍历：过滤排除窗口，同时记录命中最高优先级游戏关键词的窗口
+    for window, title in titled_windows:
+        if _EXCLUDE_KEYWORD_RE.search(title):
             continue
-            
-        # 检查是否包含排除关键词
-        should_exclude = False
-        for exclude in exclude_keywords:
-            if exclude.lower() in window.title.lower():
-                should_exclude = True
-                break
         
-        if not should_exclude:
-            valid_windows.append(window)
+        valid_windows.append(window)
+        priority = _game_keyword_priority(title)
+        if priority is not None and (best_priority is None or priority < best_priority):
+            best_window = window
+            best_priority = priority
     
     # 优先选择包含游戏关键词的窗口
-    for keyword in game_keywords:
-        for window in valid_windows:
-            if keyword.lower() in window.title.lower():
-                return window
+    if best_window is not None:
+        return best_window
     
     # 如果没有找到游戏窗口，选择第一个有效窗口（排除系统窗口）
     for window in valid_windows:
@@ -472,4 +518,4 @@ def auto_select_game_window(windows):
             window.left >= 0 and window.top >= 0):
             return window
     
-    return None
\ No newline at end of file
+    return None
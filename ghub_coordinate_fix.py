@@ -26,106 +26,31 @@ def get_cursor_position():
     ctypes.windll.user32.GetCursorPos(ctypes.byref(point))
     return point.x, point.y
 
+# 每次鼠标移动复用同一个输入结构体，只更新 x/y
+_mouse_io = MOUSE_IO()
+_mouse_io.button = ctypes.c_char(0)
+_mouse_io.wheel = ctypes.c_char(0)
+_mouse_io.unk1 = ctypes.c_char(0)
+
+def signed_byte_to_char(value):
+    """安全的字节转换：饱和到有符号字节范围后取补码低8位"""
+    return min(127, max(-128, value)) & 0xFF
+
 def safe_ghub_move(x, y):
     """安全的G-Hub移动函数，基于分析结果优化"""
     if not found:
         return False
     
-    # 基于分析结果，限制移动值范围
-    # 发现：值1-2会异常放大，值5+无响应，负值-1,-2正常
-    
-    # 策略1: 将大值分解为小步移动
-    def clamp_safe_range(value):
-        """将值限制在安全范围内"""
-        if value == 0:
-            return 0
-        elif value > 0:
-            # 正值：使用-1,-2这样的负值来实现反向移动
-            # 但这会导致方向错误，所以需要其他方法
-            return min(value, 2)  # 先尝试限制在2以内
-        else:
-            # 负值：-1,-2工作正常
-            return max(value, -2)
-    
-    # 策略2: 多步移动实现大距离
-    def multi_step_move(target_x, target_y):
-        """多步移动实现大距离"""
-        moved_x, moved_y = 0, 0
-        
-        while abs(moved_x) < abs(target_x) or abs(moved_y) < abs(target_y):
-            # 计算剩余距离
-            remaining_x = target_x - moved_x
-            remaining_y = target_y - moved_y
-            
-            # 计算这一步的移动
-            step_x = 0
-            step_y = 0
-            
-            if remaining_x != 0:
-                if remaining_x > 0:
-                    step_x = min(remaining_x, 2)  # 正向最多2
-                else:
-                    step_x = max(remaining_x, -2)  # 负向最多-2
-            
-            if remaining_y != 0:
-                if remaining_y > 0:
-                    step_y = min(remaining_y, 2)  # 正向最多2
-                else:
-                    step_y = max(remaining_y, -2)  # 负向最多-2
-            
-            if step_x == 0 and step_y == 0:
-                break
-            
-            # 执行移动
-            try:
-                result = ghub_move(step_x, step_y)
-                moved_x += step_x
-                moved_y += step_y
-                time.sleep(0.01)  # 短暂延迟
-            except:
-                break
-            
-            # 防止无限循环
-            if abs(moved_x) > abs(target_x) * 2 or abs(moved_y) > abs(target_y) * 2:
-                break
+    # 基于分析结果：ghub_move 对部分数值异常（值1-2会异常放大，值5+无响应），
+    # 而直接使用call_mouse对任意范围的值都能正常工作，所以所有移动都走这一条路径
+    try:
+        _mouse_io.x = ctypes.c_char(signed_byte_to_char(x))
+        _mouse_io.y = ctypes.c_char(signed_byte_to_char(y))
         
-        return True
-    
-    # 策略3: 直接使用call_mouse绕过ghub_move
-    def direct_call_move(x, y):
-        """直接使用call_mouse"""
-        try:
-            mouse_io = MOUSE_IO()
-            mouse_io.button = ctypes.c_char(0)
-            
-            # 使用修复后的转换方法
-            def signed_byte_to_char(value):
-                clamped = max(-128, min(127, value))
-                if clamped < 0:
-                    return clamped + 256
-                return clamped
-            
-            mouse_io.x = ctypes.c_char(signed_byte_to_char(x))
-            mouse_io.y = ctypes.c_char(signed_byte_to_char(y))
-            mouse_io.wheel = ctypes.c_char(0)
-            mouse_io.unk1 = ctypes.c_char(0)
-            
-            result = call_mouse(handle, mouse_io)
-            return result == 1
-        except:
-            return False
-    
-    # 尝试不同的策略
-    if abs(x) <= 2 and abs(y) <= 2:
-        # 小值直接移动
-        try:
-            result = ghub_move(x, y)
-            return True
-        except:
-            return direct_call_move(x, y)
-    else:
-        # 大值使用多步移动或直接调用
-        return direct_call_move(x, y)
+        result = call_mouse(handle, _mouse_io)
+        return result == 1
+    except:
+        return False
 
 def test_coordinate_fix():
     """测试坐标修复效果"""
@@ -196,52 +121,46 @@ G-Hub最终修复补丁
 import time
 import ctypes
 
+import mouse_driver.MouseMove as mouse_driver_module
+from mouse_driver.MouseMove import call_mouse, MOUSE_IO
+
+# 每次鼠标移动复用同一个输入结构体，只更新 x/y
+_mouse_io = MOUSE_IO()
+_mouse_io.button = ctypes.c_char(0)
+_mouse_io.wheel = ctypes.c_char(0)
+_mouse_io.unk1 = ctypes.c_char(0)
+
+def signed_byte_to_char(value):
+    """安全的字节转换：饱和到有符号字节范围后取补码低8位"""
+    return min(127, max(-128, value)) & 0xFF
+
 def safe_ghub_move_patch(x, y):
     """安全的G-Hub移动函数补丁"""
-    from mouse_driver.MouseMove import found, handle, call_mouse, MOUSE_IO, ghub_move
-    
-    if not found:
+    # found/handle 在重新连接后可能变化，按模块属性实时读取
+    if not mouse_driver_module.found:
         return False
     
-    def signed_byte_to_char(value):
-        """安全的字节转换"""
-        clamped = max(-128, min(127, value))
-        if clamped < 0:
-            return clamped + 256
-        return clamped
-    
-    def direct_call_move(x, y):
-        """直接调用call_mouse"""
-        try:
-            mouse_io = MOUSE_IO()
-            mouse_io.button = ctypes.c_char(0)
-            mouse_io.x = ctypes.c_char(signed_byte_to_char(x))
-            mouse_io.y = ctypes.c_char(signed_byte_to_char(y))
-            mouse_io.wheel = ctypes.c_char(0)
-            mouse_io.unk1 = ctypes.c_char(0)
-            
-            result = call_mouse(handle, mouse_io)
-            return result == 1
-        except:
-            return False
-    
     # 对于所有移动，直接使用call_mouse
     # 这避免了ghub_move的数值范围问题
-    return direct_call_move(x, y)
+    try:
+        _mouse_io.x = ctypes.c_char(signed_byte_to_char(x))
+        _mouse_io.y = ctypes.c_char(signed_byte_to_char(y))
+        
+        result = call_mouse(mouse_driver_module.handle, _mouse_io)
+        return result == 1
+    except:
+        return False
 
 # 应用补丁
 def apply_patch():
     """应用G-Hub修复补丁"""
-    import mouse_driver.MouseMove as mm
+    mm = mouse_driver_module
     
     # 备份原函数
     mm._original_ghub_move = mm.ghub_move
     
     # 替换为修复版本
-    def patched_ghub_move(x, y):
-        return safe_ghub_move_patch(x, y)
-    
-    mm.ghub_move = patched_ghub_move
+    mm.ghub_move = safe_ghub_move_patch
     print("✅ G-Hub修复补丁已应用")
 
 if __name__ == "__main__":
@@ -32,16 +32,15 @@ def check_ghub_processes():
     ]
     
     running_processes = []
-    
-    for proc in psutil.process_iter(['pid', 'name']):
-        try:
-            proc_name = proc.info['name'].lower()
-            for ghub_proc in ghub_processes:
-                if ghub_proc.lower() in proc_name:
-                    running_processes.append((proc.info['name'], proc.info['pid']))
-                    print(f"✓ 找到进程: {proc.info['name']} (PID: {proc.info['pid']})")
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
+    # 进程名统一小写后做集合查找，每个进程只需一次哈希查找
+    ghub_set = frozenset(name.lower() for name in ghub_processes)
+    
+    # ad_value=None：无权限读取的字段直接返回None，无需逐进程捕获异常
+    for proc in psutil.process_iter(['pid', 'name'], ad_value=None):
+        proc_name = proc.info['name']
+        if proc_name and proc_name.lower() in ghub_set:
+            running_processes.append((proc_name, proc.info['pid']))
+            print(f"✓ 找到进程: {proc_name} (PID: {proc.info['pid']})")
     
     if not running_processes:
         print("⚠️  没有找到G-Hub相关进程")
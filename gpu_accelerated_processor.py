@@ -9,10 +9,12 @@ GPU加速图像处理器
 import numpy as np
 import cv2
 import time
-import gc
+import contextlib
+import collections
 from typing import Tuple, Optional, Any
 import torch
 import torch.nn.functional as F
+import torch.utils.dlpack
 
 try:
     import cupy as cp
@@ -22,177 +24,571 @@ except ImportError:
     CUPY_AVAILABLE = False
     print("[WARNING] CuPy不可用，使用PyTorch CUDA")
 
+# CV-CUDA 可选：可用时回退路径直接在GPU上对uint8图像做缩放
+try:
+    import cvcuda
+    CVCUDA_AVAILABLE = True
+except ImportError:
+    CVCUDA_AVAILABLE = False
+
+# 常见帧尺寸（HWC），启动时预先分配对应的锁页主机缓冲区
+COMMON_FRAME_SIZES = [
+    (320, 320, 3),    # AI检测图像
+    (640, 640, 3),    # 高分辨率检测
+    (1080, 1920, 3),  # 全屏截图
+]
+
+# 每种预处理尺寸轮换使用的CUDA Graph份数
+GRAPH_RING_SIZE = 2
+
+# 后处理输出缓冲区的初始行数（超过时按实际数量扩容）
+MAX_DETECTIONS = 1000
+
+# 启动预热的 (输入帧形状, 目标尺寸) 组合：提前完成缓存分配器的显存分配和CUDA Graph捕获
+WARMUP_SHAPES = [
+    ((320, 320, 3), (320, 320)),     # 截图区域直接作为检测输入
+    ((1080, 1920, 3), (320, 320)),   # 全屏截图缩放到检测尺寸
+    ((1080, 1920, 3), (640, 640)),   # 全屏截图缩放到高分辨率检测尺寸
+]
+
+# 每种帧尺寸轮换使用的锁页主机缓冲区数量：上一帧的异步传输未完成时可以写入下一个槽位
+PINNED_RING_SIZE = 2
+
+def _mask_and_scale(img: torch.Tensor, mask_h: int, mask_w: int, mask_right: bool, scale: float) -> torch.Tensor:
+    """
+    NCHW图像转为float16并乘以scale，同时将底部右侧/左侧的矩形区域置零
+    
+    掩码由行列比较广播得到，不做索引赋值；编译后类型转换、缩放和置零在同一个kernel中完成
+    """
+    _, _, height, width = img.shape
+    rows = torch.arange(height, device=img.device).view(height, 1) >= height - mask_h
+    cols = torch.arange(width, device=img.device).view(1, width)
+    cols = cols >= width - mask_w if mask_right else cols < mask_w
+    keep = (~(rows & cols)).to(torch.float16)
+    return (img.to(torch.float16) * keep * scale).contiguous()
+
+def _nchw_to_fp16(img: torch.Tensor) -> torch.Tensor:
+    """
+    NCHW视图（可由HWC uint8经permute得到）转为连续的float16 [0,1] 张量
+    
+    编译后读取一遍uint8、写出一遍float16，类型转换、归一化和转为连续内存在同一个kernel中完成
+    """
+    return (img.to(torch.float16) * (1.0 / 255.0)).contiguous()
+
+def _compiled_with_fallback(fn, description: str):
+    """
+    用 torch.compile 编译融合kernel；torch.compile 不可用（如缺少Triton）时首次调用失败，
+    之后回退到逐算子执行。不使用 reduce-overhead/max-autotune 模式，它们内部的CUDA Graph
+    会与预处理自身捕获的CUDA Graph冲突
+    """
+    compiled = [torch.compile(fn, fullgraph=True) if hasattr(torch, 'compile') else None]
+    
+    def wrapper(*args):
+        if compiled[0] is not None:
+            try:
+                return compiled[0](*args)
+            except Exception as e:
+                print(f"[WARNING] torch.compile{description}kernel不可用，回退到普通实现: {e}")
+                compiled[0] = None
+        return fn(*args)
+    
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+# 掩码+缩放、格式转换+归一化：优先使用编译后的融合kernel
+mask_and_scale = _compiled_with_fallback(_mask_and_scale, "掩码")
+nchw_to_fp16 = _compiled_with_fallback(_nchw_to_fp16, "格式转换")
+
+def parse_mask_config(mask_config: Optional[dict]) -> Optional[tuple]:
+    """掩码配置 -> (mask_h, mask_w, mask_right)，未启用或side无效时返回None"""
+    if not mask_config or not mask_config.get('enabled', False):
+        return None
+    mask_side = mask_config.get('side', 'right').lower()
+    if mask_side not in ('right', 'left'):
+        return None
+    return mask_config.get('height', 100), mask_config.get('width', 100), mask_side == 'right'
+
+# GPU阶段计时的采样间隔（帧）：每N次调用记录一次CUDA事件
+STATS_SAMPLE_INTERVAL = 30
+# 耗时统计只保留最近的样本数，长时间运行内存不增长
+STATS_WINDOW_SIZE = 512
+
+class TimingWindow:
+    """固定长度的耗时样本窗口，维护窗口内的累计值，均值查询为O(1)"""
+    
+    def __init__(self, maxlen: int = STATS_WINDOW_SIZE):
+        self.samples = collections.deque(maxlen=maxlen)
+        self.total = 0.0
+        
+    def append(self, value: float):
+        if len(self.samples) == self.samples.maxlen:
+            self.total -= self.samples[0]
+        self.samples.append(value)
+        self.total += value
+        
+    def clear(self):
+        self.samples.clear()
+        self.total = 0.0
+        
+    def __len__(self) -> int:
+        return len(self.samples)
+        
+    def mean(self) -> float:
+        return self.total / len(self.samples) if self.samples else 0.0
+        
+    def max(self) -> float:
+        return max(self.samples, default=0.0)
+
+class GPUStageTimer:
+    """
+    用CUDA事件统计GPU阶段耗时
+    
+    GPU算子是异步启动的，time.time() 只能量到启动耗时；这里每隔若干次调用记录一对CUDA事件，
+    之后在结束事件完成时（query() 非阻塞检查）才读取耗时，热路径上不引入同步
+    """
+    
+    def __init__(self, samples: 'TimingWindow', device: str, interval: int = STATS_SAMPLE_INTERVAL):
+        self.samples = samples
+        self.device = device
+        self.interval = interval
+        self.calls = 0
+        self.pending = False
+        self.sampling = False
+        self.start_event = torch.cuda.Event(enable_timing=True)
+        self.end_event = torch.cuda.Event(enable_timing=True)
+        
+    def start(self):
+        self.collect()
+        self.sampling = not self.pending and self.calls % self.interval == 0
+        self.calls += 1
+        if self.sampling:
+            self.start_event.record(torch.cuda.current_stream(self.device))
+            
+    def stop(self):
+        if self.sampling:
+            self.end_event.record(torch.cuda.current_stream(self.device))
+            self.pending = True
+            self.sampling = False
+            
+    def collect(self, wait: bool = False):
+        """结束事件已完成时读取耗时（秒）；wait=True 时等待完成（仅用于统计汇总）"""
+        if not self.pending:
+            return
+        if wait:
+            self.end_event.synchronize()
+        elif not self.end_event.query():
+            return
+        self.samples.append(self.start_event.elapsed_time(self.end_event) / 1000.0)
+        self.pending = False
+
+def is_device_array(img) -> bool:
+    """输入是否已经是GPU上的数组（torch张量或实现了 __cuda_array_interface__ 的CuPy等数组）"""
+    return isinstance(img, torch.Tensor) or hasattr(img, '__cuda_array_interface__')
+
 class GPUAcceleratedProcessor:
     """GPU加速图像处理器"""
     
-    def __init__(self, device_id: int = 0, enable_memory_pool: bool = True):
+    def __init__(self, device_id: int = 0, enable_memory_pool: bool = True, enable_cuda_graph: bool = True):
         """
         初始化GPU加速处理器
         
         Args:
             device_id: GPU设备ID
             enable_memory_pool: 是否启用GPU内存池
+            enable_cuda_graph: 是否用CUDA Graph重放固定尺寸的预处理流程
         """
         self.device_id = device_id
-        self.device = f'cuda:{device_id}' if torch.cuda.is_available() else 'cpu'
+        self.cuda_available = torch.cuda.is_available()
+        self.device = f'cuda:{device_id}' if self.cuda_available else 'cpu'
+        # 显存总量不会变化，只查询一次
+        self._total_mem_gb = (torch.cuda.get_device_properties(device_id).total_memory / 1024**3
+                              if self.cuda_available else 0)
         self.enable_memory_pool = enable_memory_pool
         
-        # GPU内存池
-        self.memory_pool = {}
-        self.pool_usage = {}
+        # 私有GPU内存池：预处理张量由PyTorch缓存分配器从独立的内存池中分配，
+        # 按流顺序复用并处理碎片，不再手动维护每个尺寸的占用标记
+        self.mem_pool = None
+        if enable_memory_pool and torch.cuda.is_available() and hasattr(torch.cuda, 'MemPool'):
+            try:
+                self.mem_pool = torch.cuda.MemPool()
+            except Exception as e:
+                print(f"[WARNING] GPU内存池创建失败: {e}")
+        
+        # 锁页主机内存环形缓冲区：(shape, dtype) -> [[锁页张量, 完成事件], ...]
+        self.pinned_buffers = {}
+        self.pinned_index = {}
+        # 独立的传输流，主机到显存的拷贝不占用计算流
+        self.copy_stream = torch.cuda.Stream(device=self.device) if torch.cuda.is_available() else None
+        
+        # 独立的预处理流：下一帧的预处理不必排在上一帧推理之后，两者可以重叠执行
+        self.preproc_stream = torch.cuda.Stream(device=self.device) if self.cuda_available else None
+        # 上一次预处理调用时在推理流上记录的事件，复用两帧前的graph输出缓冲区前需等待它
+        self._last_consumer_mark = None
+        self._reuse_guard = None
         
-        # 预分配常用尺寸的GPU内存
-        self._preallocate_memory()
+        # 预处理CUDA Graph：(输入形状, 目标尺寸, 掩码) -> [(graph, 静态输入, 静态输出), ...]
+        # 每帧的算子序列完全相同，捕获一次后只需一次重放，省去逐个算子的Python分发和kernel启动开销；
+        # 每个尺寸轮换使用 GRAPH_RING_SIZE 份，推理读取上一帧输出时可以同时预处理下一帧
+        self.enable_cuda_graph = enable_cuda_graph and torch.cuda.is_available()
+        self.graphs = {}
+        self.graph_index = {}
+        # 所有预处理graph共享同一个显存池
+        self.graph_pool = torch.cuda.graph_pool_handle() if self.enable_cuda_graph else None
+        
+        # 预分配常见帧尺寸的锁页主机内存
+        self._preallocate_pinned_memory()
+        
+        # 后处理输出缓冲区（首次调用时按模型输出的列数分配）
+        self._det_out = None
+        self._postprocess_device_checked = False
         
         # 性能统计
         self.stats = {
-            'gpu_preprocessing_time': [],
-            'gpu_postprocessing_time': [],
-            'memory_transfers': 0,
-            'cache_hits': 0,
-            'cache_misses': 0
+            'gpu_preprocessing_time': TimingWindow(),
+            'gpu_postprocessing_time': TimingWindow(),
+            'memory_transfers': 0
         }
         
+        # 有CUDA时用CUDA事件计时（采样），否则仍用墙钟时间
+        if self.cuda_available:
+            self.preprocess_timer = GPUStageTimer(self.stats['gpu_preprocessing_time'], self.device)
+            self.postprocess_timer = GPUStageTimer(self.stats['gpu_postprocessing_time'], self.device)
+        else:
+            self.preprocess_timer = None
+            self.postprocess_timer = None
+        
+        # 预热常用尺寸，避免第一帧承担cudaMalloc和graph捕获的开销
+        self.warmup()
+        
         print(f"[INFO] 🚀 GPU加速处理器初始化完成")
         print(f"[INFO] 设备: {self.device}")
-        print(f"[INFO] 内存池: {'启用' if enable_memory_pool else '禁用'}")
+        print(f"[INFO] 内存池: {'启用' if self.mem_pool is not None else '禁用'}")
         
-    def _preallocate_memory(self):
-        """预分配GPU内存池"""
-        if not torch.cuda.is_available():
+    def warmup(self, shapes: Optional[list] = None, iterations: int = 2):
+        """
+        用空白帧把预处理流程跑几遍，预先填充缓存分配器并捕获CUDA Graph
+        
+        Args:
+            shapes: (输入帧形状, 目标尺寸) 列表，默认 WARMUP_SHAPES
+            iterations: 每个组合运行的次数
+        """
+        if not self.cuda_available:
             return
             
         try:
-            # 预分配常用尺寸的内存
-            common_sizes = [
-                (320, 320, 3),    # AI检测图像
-                (640, 640, 3),    # 高分辨率检测
-                (1920, 1080, 3),  # 全屏截图
-                (1, 3, 320, 320), # NCHW格式
-                (1, 3, 640, 640), # 高分辨率NCHW
-            ]
-            
-            for size in common_sizes:
-                key = f"buffer_{size}"
-                if self.enable_memory_pool:
-                    buffer = torch.empty(size, dtype=torch.float16, device=self.device)
-                    self.memory_pool[key] = buffer
-                    self.pool_usage[key] = False
-                    
-            print(f"[INFO] 📦 预分配了{len(common_sizes)}个GPU内存缓冲区")
+            start_time = time.time()
+            for input_shape, target_size in (shapes or WARMUP_SHAPES):
+                dummy = np.zeros(input_shape, dtype=np.uint8)
+                for _ in range(iterations):
+                    self.preprocess_image_gpu(dummy, target_size)
+            torch.cuda.synchronize(self.device)
+            
+            # 预热数据不计入性能统计
+            for timer in (self.preprocess_timer, self.postprocess_timer):
+                timer.collect(wait=True)
+            self.stats['gpu_preprocessing_time'].clear()
+            self.stats['memory_transfers'] = 0
+            
+            print(f"[INFO] 🔥 预处理预热完成，耗时 {(time.time() - start_time)*1000:.1f}ms")
+            
+        except Exception as e:
+            print(f"[WARNING] 预处理预热失败: {e}")
+            
+    def _preallocate_pinned_memory(self):
+        """预分配常见帧尺寸（HWC）的uint8锁页主机缓冲区"""
+        if self.copy_stream is None:
+            return
+            
+        try:
+            for size in COMMON_FRAME_SIZES:
+                self._get_pinned_slot(size, torch.uint8)
+            print(f"[INFO] 📦 预分配了{len(COMMON_FRAME_SIZES)}种尺寸的锁页主机缓冲区")
             
         except Exception as e:
-            print(f"[WARNING] GPU内存预分配失败: {e}")
+            print(f"[WARNING] 锁页内存预分配失败: {e}")
             
-    def get_gpu_buffer(self, shape: Tuple, dtype=torch.float16) -> torch.Tensor:
+    def _get_pinned_slot(self, shape: Tuple, dtype) -> list:
+        """从环形缓冲区中取下一个锁页主机缓冲区槽位（首次遇到该尺寸时分配）"""
+        key = (tuple(shape), dtype)
+        slots = self.pinned_buffers.get(key)
+        if slots is None:
+            slots = [[torch.empty(shape, dtype=dtype, pin_memory=True), None]
+                     for _ in range(PINNED_RING_SIZE)]
+            self.pinned_buffers[key] = slots
+            self.pinned_index[key] = 0
+        
+        index = self.pinned_index[key]
+        self.pinned_index[key] = (index + 1) % PINNED_RING_SIZE
+        return slots[index]
+        
+    def _copy_to_pinned(self, img: np.ndarray, dst: Optional[torch.Tensor] = None) -> torch.Tensor:
         """
-        获取GPU内存缓冲区（支持内存池复用）
+        将numpy图像经锁页内存异步传输到GPU
         
         Args:
-            shape: 张量形状
-            dtype: 数据类型
+            img: 输入图像 (numpy数组)
+            dst: 可选的目标GPU张量（形状相同），提供时直接写入该张量
             
         Returns:
-            GPU张量缓冲区
+            GPU张量（已与当前计算流同步，可直接使用）
         """
-        key = f"buffer_{shape}"
-        
-        # 尝试从内存池获取
-        if self.enable_memory_pool and key in self.memory_pool:
-            if not self.pool_usage[key]:
-                self.pool_usage[key] = True
-                self.stats['cache_hits'] += 1
-                return self.memory_pool[key]
-        
-        # 创建新的缓冲区
-        self.stats['cache_misses'] += 1
-        return torch.empty(shape, dtype=dtype, device=self.device)
-        
-    def release_gpu_buffer(self, shape: Tuple):
-        """释放GPU内存缓冲区"""
-        key = f"buffer_{shape}"
-        if key in self.pool_usage:
-            self.pool_usage[key] = False
-            
-    def preprocess_image_gpu(self, img: np.ndarray, target_size: Tuple[int, int] = (320, 320)) -> torch.Tensor:
+        host_tensor = torch.from_numpy(img)
+        if self.copy_stream is None:
+            return host_tensor.to(self.device) if dst is None else dst.copy_(host_tensor)
+        
+        slot = self._get_pinned_slot(img.shape, host_tensor.dtype)
+        pinned, copy_done = slot
+        # 该槽位上一次的异步传输完成前不能覆写
+        if copy_done is not None:
+            copy_done.synchronize()
+        pinned.copy_(host_tensor)
+        
+        compute_stream = torch.cuda.current_stream(self.device)
+        if dst is not None:
+            # dst 可能仍被计算流上之前的工作读取
+            self.copy_stream.wait_stream(compute_stream)
+        
+        with torch.cuda.stream(self.copy_stream):
+            if dst is None:
+                gpu_tensor = pinned.to(self.device, non_blocking=True)
+            else:
+                gpu_tensor = dst.copy_(pinned, non_blocking=True)
+            copy_done = torch.cuda.Event()
+            copy_done.record(self.copy_stream)
+        slot[1] = copy_done
+        
+        # 计算流等待传输完成
+        compute_stream.wait_stream(self.copy_stream)
+        if dst is None:
+            # 张量在传输流上分配，需要告知分配器它也在计算流上使用
+            gpu_tensor.record_stream(compute_stream)
+        return gpu_tensor
+        
+    def _use_mem_pool(self):
+        """在私有内存池中分配张量的上下文（内存池不可用时为空上下文）"""
+        if self.mem_pool is None:
+            return contextlib.nullcontext()
+        return torch.cuda.memory.use_mem_pool(self.mem_pool, device=self.device)
+            
+    def preprocess_image_gpu(self, img: np.ndarray, target_size: Tuple[int, int] = (320, 320),
+                             mask_config: Optional[dict] = None) -> torch.Tensor:
         """
         GPU加速图像预处理
         
         Args:
-            img: 输入图像 (numpy数组)
+            img: 输入图像 (numpy数组；也可以是已在GPU上的torch张量/CuPy数组，此时跳过主机到显存传输)
             target_size: 目标尺寸
+            mask_config: 可选的掩码配置（同 apply_mask_gpu），与归一化在同一个kernel中完成
             
         Returns:
-            预处理后的GPU张量 (NCHW格式)
+            预处理后的GPU张量 (NCHW格式)，已与当前流同步。使用CUDA Graph时返回的是graph的静态输出，
+            后续调用会被覆盖，需要保留时请先拷贝
         """
+        if not self.cuda_available:
+            return self._preprocess_image(img, target_size, mask_config)
+        
+        # 预处理在独立的流上执行，不必排在推理流上尚未完成的工作之后
+        consumer_stream = torch.cuda.current_stream(self.device)
+        
+        # 记录推理流上已提交的工作；它覆盖了两次调用之前那一帧的推理
+        consumer_mark = torch.cuda.Event()
+        consumer_mark.record(consumer_stream)
+        self._reuse_guard = self._last_consumer_mark
+        self._last_consumer_mark = consumer_mark
+        
+        if is_device_array(img):
+            # GPU上的输入由调用方的流产生，预处理前需等待其完成
+            self.preproc_stream.wait_event(consumer_mark)
+        
+        with torch.cuda.stream(self.preproc_stream):
+            tensor = self._preprocess_image(img, target_size, mask_config)
+            done = torch.cuda.Event()
+            done.record(self.preproc_stream)
+        
+        if tensor.is_cuda:
+            # 结果在预处理流上分配、在推理流上使用，告知缓存分配器避免跨流提前复用
+            tensor.record_stream(consumer_stream)
+        consumer_stream.wait_event(done)
+        return tensor
+        
+    def _preprocess_image(self, img: np.ndarray, target_size: Tuple[int, int], mask_config: Optional[dict]) -> torch.Tensor:
+        """在当前流上执行预处理（含回退路径和计时）"""
+        on_device = is_device_array(img)
+        if on_device:
+            # 已在GPU上的数组零拷贝包装为torch张量
+            img = torch.as_tensor(img, device=self.device)
+        
+        # 只接受uint8帧：在GPU上再转换类型，避免把float数据送过PCIe
+        if img.dtype not in (np.uint8, torch.uint8):
+            raise TypeError(f"preprocess_image_gpu 只接受uint8图像，实际为 {img.dtype}")
+        
+        mask = parse_mask_config(mask_config)
         start_time = time.time()
+        if self.preprocess_timer is not None:
+            self.preprocess_timer.start()
         
         try:
-            if CUPY_AVAILABLE:
-                # 使用CuPy进行GPU加速
-                return self._preprocess_with_cupy(img, target_size)
-            else:
-                # 使用PyTorch CUDA进行加速
-                return self._preprocess_with_torch(img, target_size)
+            if on_device:
+                # 输入已在GPU上：没有任何传输，直接格式转换、缩放和归一化
+                return self._to_nchw_output(img, target_size, mask)
+            
+            if self.enable_cuda_graph:
+                # 使用CUDA Graph重放预处理流程
+                return self._preprocess_with_graph(img, target_size, mask)
+            
+            with self._use_mem_pool():
+                if CUPY_AVAILABLE:
+                    # 使用CuPy进行GPU加速
+                    return self._preprocess_with_cupy(img, target_size, mask)
+                else:
+                    # 使用PyTorch CUDA进行加速
+                    return self._preprocess_with_torch(img, target_size, mask)
                 
         except Exception as e:
+            if on_device:
+                raise
+            if self.cuda_available:
+                # 有CUDA时回退路径仍在GPU上完成，不走CPU缩放/归一化
+                try:
+                    print(f"[WARNING] GPU预处理失败，回退到基础GPU路径: {e}")
+                    return self._preprocess_gpu_fallback(img, target_size, mask)
+                except Exception as e2:
+                    e = e2
             print(f"[WARNING] GPU预处理失败，回退到CPU: {e}")
-            return self._preprocess_cpu_fallback(img, target_size)
+            return self.apply_mask_gpu(self._preprocess_cpu_fallback(img, target_size), mask_config)
         finally:
-            processing_time = time.time() - start_time
-            self.stats['gpu_preprocessing_time'].append(processing_time)
+            if self.preprocess_timer is not None:
+                self.preprocess_timer.stop()
+            else:
+                processing_time = time.time() - start_time
+                self.stats['gpu_preprocessing_time'].append(processing_time)
             
-    def _preprocess_with_cupy(self, img: np.ndarray, target_size: Tuple[int, int]) -> torch.Tensor:
+    def _preprocess_with_cupy(self, img: np.ndarray, target_size: Tuple[int, int], mask: Optional[tuple] = None) -> torch.Tensor:
         """使用CuPy进行GPU加速预处理"""
-        # 将numpy数组转换为CuPy数组（GPU）
-        gpu_img = cp.asarray(img)
+        # 将numpy数组转换为CuPy数组（GPU），这是整个预处理唯一的一次主机到显存传输；
+        # 在PyTorch当前流上执行，保证与后续算子的顺序
+        current_stream = torch.cuda.current_stream(self.device)
+        with cp.cuda.Device(self.device_id), cp.cuda.ExternalStream(current_stream.cuda_stream):
+            gpu_img = cp.ascontiguousarray(cp.asarray(img))
         
-        # 移除alpha通道（如果存在）
-        if gpu_img.shape[2] == 4:
-            gpu_img = gpu_img[:, :, :3]
-        
-        # GPU上进行图像缩放
-        if gpu_img.shape[:2] != target_size:
-            # CuPy没有直接的resize，使用PyTorch
-            torch_img = torch.from_numpy(cp.asnumpy(gpu_img)).to(self.device)
-            torch_img = torch_img.permute(2, 0, 1).unsqueeze(0).float()  # HWC -> NCHW
-            torch_img = F.interpolate(torch_img, size=target_size, mode='bilinear', align_corners=False)
-        else:
-            torch_img = torch.from_numpy(cp.asnumpy(gpu_img)).to(self.device)
-            torch_img = torch_img.permute(2, 0, 1).unsqueeze(0).float()
+        # 通过DLPack零拷贝地把CuPy显存交给PyTorch，像素数据始终留在GPU上
+        torch_img = torch.utils.dlpack.from_dlpack(gpu_img.toDlpack())
         
-        # 归一化和类型转换
-        torch_img = torch_img / 255.0
-        torch_img = torch_img.half()  # 转换为float16
+        # 格式转换、缩放和归一化（CuPy没有直接的resize，使用PyTorch）
+        torch_img = self._to_nchw_output(torch_img, target_size, mask)
         
         self.stats['memory_transfers'] += 1
         return torch_img
         
-    def _preprocess_with_torch(self, img: np.ndarray, target_size: Tuple[int, int]) -> torch.Tensor:
+    def _preprocess_with_torch(self, img: np.ndarray, target_size: Tuple[int, int], mask: Optional[tuple] = None) -> torch.Tensor:
         """使用PyTorch CUDA进行加速预处理"""
-        # 转换为PyTorch张量并移到GPU
+        # 以uint8传输到GPU（带宽只有float32的1/4），类型转换和归一化都在GPU上完成
+        torch_img = self._copy_to_pinned(img)
+        
+        # GPU上进行格式转换、缩放和归一化
+        torch_img = self._to_nchw_output(torch_img, target_size, mask)
+        
+        self.stats['memory_transfers'] += 1
+        return torch_img
+        
+    def _preprocess_with_graph(self, img: np.ndarray, target_size: Tuple[int, int], mask: Optional[tuple] = None) -> torch.Tensor:
+        """使用CUDA Graph进行GPU加速预处理"""
+        key = (img.shape, tuple(target_size), mask)
+        entries = self.graphs.get(key)
+        if entries is None:
+            try:
+                entries = [self._capture_preprocess_graph(img.shape, target_size, mask)
+                           for _ in range(GRAPH_RING_SIZE)]
+            except Exception as e:
+                # 捕获失败时不再尝试，后续都走普通路径
+                print(f"[WARNING] CUDA Graph捕获失败，禁用CUDA Graph: {e}")
+                self.enable_cuda_graph = False
+                return self._preprocess_with_torch(img, target_size, mask)
+            self.graphs[key] = entries
+            self.graph_index[key] = 0
+        
+        index = self.graph_index[key]
+        self.graph_index[key] = (index + 1) % GRAPH_RING_SIZE
+        graph, static_in, static_out = entries[index]
+        
+        # 该份静态缓冲区上一次的输出可能仍在被推理读取
+        if self._reuse_guard is not None:
+            torch.cuda.current_stream(self.device).wait_event(self._reuse_guard)
+        
+        # 经锁页内存直接传输到graph的静态输入，再重放整个预处理流程
+        self._copy_to_pinned(img, dst=static_in)
+        graph.replay()
+        
+        self.stats['memory_transfers'] += 1
+        return static_out
+        
+    def _capture_preprocess_graph(self, input_shape: Tuple, target_size: Tuple[int, int], mask: Optional[tuple] = None) -> tuple:
+        """为给定的输入形状和目标尺寸捕获预处理CUDA Graph"""
+        static_in = torch.zeros(input_shape, dtype=torch.uint8, device=self.device)
+        
+        # 捕获前先在旁路流上预热几次
+        compute_stream = torch.cuda.current_stream(self.device)
+        warmup_stream = torch.cuda.Stream(device=self.device)
+        warmup_stream.wait_stream(compute_stream)
+        with torch.cuda.stream(warmup_stream):
+            for _ in range(3):
+                self._to_nchw_output(static_in, target_size, mask)
+        compute_stream.wait_stream(warmup_stream)
+        
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=self.graph_pool):
+            static_out = self._to_nchw_output(static_in, target_size, mask)
+        
+        print(f"[INFO] 📸 已捕获预处理CUDA Graph: {tuple(input_shape)} -> {tuple(target_size)}")
+        return graph, static_in, static_out
+        
+    def _to_nchw_output(self, torch_img: torch.Tensor, target_size: Tuple[int, int], mask: Optional[tuple] = None) -> torch.Tensor:
+        """
+        GPU上的HWC/NHWC uint8图像 -> (N, 3, H, W) float16 [0,1] 张量（HWC时N=1）
+        
+        类型转换、归一化（及掩码）在同一个融合kernel中完成，不产生float32中间张量
+        """
+        if torch_img.dim() == 3:
+            torch_img = torch_img.unsqueeze(0)
+        
+        # 移除alpha通道（如果存在）
+        if torch_img.shape[3] == 4:
+            torch_img = torch_img[..., :3]
+        
+        # 转换为NCHW格式
+        out = torch_img.permute(0, 3, 1, 2)
+        
+        # GPU上进行图像缩放
+        if out.shape[2:] != target_size:
+            out = F.interpolate(out.to(torch.float16), size=target_size, mode='bilinear', align_corners=False)
+        
+        if mask is not None:
+            return mask_and_scale(out, *mask, 1.0 / 255.0)
+        return nchw_to_fp16(out)
+        
+    def _preprocess_gpu_fallback(self, img: np.ndarray, target_size: Tuple[int, int], mask: Optional[tuple] = None) -> torch.Tensor:
+        """GPU回退预处理：普通同步传输，缩放和归一化仍在GPU上完成"""
         torch_img = torch.from_numpy(img).to(self.device)
         
         # 移除alpha通道（如果存在）
         if torch_img.shape[2] == 4:
             torch_img = torch_img[:, :, :3]
-            
-        # 转换为NCHW格式
-        torch_img = torch_img.permute(2, 0, 1).unsqueeze(0).float()
         
-        # GPU上进行图像缩放
-        if torch_img.shape[2:] != target_size:
-            torch_img = F.interpolate(torch_img, size=target_size, mode='bilinear', align_corners=False)
+        # CV-CUDA 可直接缩放uint8图像，省去缩放前的float16转换
+        if CVCUDA_AVAILABLE and tuple(torch_img.shape[:2]) != tuple(target_size):
+            torch_img = self._resize_with_cvcuda(torch_img, target_size)
         
-        # 归一化和类型转换
-        torch_img = torch_img / 255.0
-        torch_img = torch_img.half()  # 转换为float16节省显存
+        return self._to_nchw_output(torch_img, target_size, mask)
         
-        self.stats['memory_transfers'] += 1
-        return torch_img
+    def _resize_with_cvcuda(self, torch_img: torch.Tensor, target_size: Tuple[int, int]) -> torch.Tensor:
+        """使用CV-CUDA在GPU上缩放HWC uint8图像"""
+        height, width = target_size
+        src = cvcuda.as_tensor(torch_img.unsqueeze(0).contiguous(), "NHWC")
+        dst = cvcuda.resize(src, (1, height, width, torch_img.shape[2]), cvcuda.Interp.LINEAR)
+        return torch.as_tensor(dst.cuda(), device=self.device)[0]
         
     def _preprocess_cpu_fallback(self, img: np.ndarray, target_size: Tuple[int, int]) -> torch.Tensor:
-        """CPU回退预处理"""
+        """CPU回退预处理（仅在没有CUDA或GPU回退也失败时使用）"""
         # 传统的CPU预处理
         if img.shape[:2] != target_size:
             img = cv2.resize(img, target_size)
@@ -204,7 +600,7 @@ class GPUAcceleratedProcessor:
         img = np.moveaxis(img, 2, 0)  # HWC -> CHW
         img = np.expand_dims(img, 0)  # CHW -> NCHW
         
-        return torch.from_numpy(img).to(self.device)
+        return self._copy_to_pinned(np.ascontiguousarray(img))
         
     def postprocess_detections_gpu(self, outputs: torch.Tensor, conf_threshold: float = 0.5) -> torch.Tensor:
         """
@@ -215,18 +611,29 @@ class GPUAcceleratedProcessor:
             conf_threshold: 置信度阈值
             
         Returns:
-            处理后的检测结果
+            处理后的检测结果 (K, C)。返回的是预分配输出缓冲区的视图，下一次调用会被覆盖
         """
         start_time = time.time()
+        if self.postprocess_timer is not None:
+            self.postprocess_timer.start()
         
         try:
-            # 确保张量在GPU上
-            if not outputs.is_cuda:
-                outputs = outputs.to(self.device)
+            # 稳态下模型输出总在同一设备上，只在首次调用时检查一次（-O 运行时跳过）
+            if not self._postprocess_device_checked:
+                assert outputs.device == torch.device(self.device), \
+                    f"模型输出在 {outputs.device}，预期在 {self.device}"
+                self._postprocess_device_checked = True
+            
+            # GPU上进行置信度筛选：按行索引取出，结果写入预分配缓冲区，避免每帧分配新张量
+            rows = outputs.reshape(-1, outputs.shape[-1])
+            idx = (rows[:, 4] > conf_threshold).nonzero(as_tuple=False).squeeze(1)
+            count = idx.shape[0]
             
-            # GPU上进行置信度筛选
-            conf_mask = outputs[..., 4] > conf_threshold
-            filtered_outputs = outputs[conf_mask]
+            det_out = self._det_out
+            if det_out is None or det_out.shape[0] < count or det_out.shape[1] != rows.shape[1] or det_out.dtype != rows.dtype:
+                det_out = torch.empty((max(count, MAX_DETECTIONS), rows.shape[1]), dtype=rows.dtype, device=rows.device)
+                self._det_out = det_out
+            filtered_outputs = torch.index_select(rows, 0, idx, out=det_out[:count])
             
             # GPU上进行坐标转换等计算
             # 这里可以添加更多GPU加速的后处理操作
@@ -237,26 +644,21 @@ class GPUAcceleratedProcessor:
             print(f"[WARNING] GPU后处理失败: {e}")
             return outputs
         finally:
-            processing_time = time.time() - start_time
-            self.stats['gpu_postprocessing_time'].append(processing_time)
+            if self.postprocess_timer is not None:
+                self.postprocess_timer.stop()
+            else:
+                processing_time = time.time() - start_time
+                self.stats['gpu_postprocessing_time'].append(processing_time)
             
     def apply_mask_gpu(self, img: torch.Tensor, mask_config: dict) -> torch.Tensor:
-        """GPU加速掩码应用"""
-        if not mask_config.get('enabled', False):
+        """GPU加速掩码应用（预处理时传入 mask_config 可与归一化融合，无需再单独调用）"""
+        mask = parse_mask_config(mask_config)
+        if mask is None:
             return img
             
         try:
-            # 在GPU上应用掩码
-            mask_side = mask_config.get('side', 'right').lower()
-            mask_width = mask_config.get('width', 100)
-            mask_height = mask_config.get('height', 100)
-            
-            if mask_side == 'right':
-                img[:, :, -mask_height:, -mask_width:] = 0
-            elif mask_side == 'left':
-                img[:, :, -mask_height:, :mask_width] = 0
-                
-            return img
+            # 在GPU上应用掩码（融合kernel，scale为1不改变数值）
+            return mask_and_scale(img, *mask, 1.0)
             
         except Exception as e:
             print(f"[WARNING] GPU掩码应用失败: {e}")
@@ -268,8 +670,9 @@ class GPUAcceleratedProcessor:
             return {'gpu_memory_used': 0, 'gpu_memory_total': 0}
             
         try:
-            memory_used = torch.cuda.memory_allocated(self.device_id) / 1024**3  # GB
-            memory_total = torch.cuda.get_device_properties(self.device_id).total_memory / 1024**3  # GB
+            # 缓存分配器已占用的显存（含缓存块），只读取分配器计数，无需查询设备属性
+            memory_used = torch.cuda.memory_reserved(self.device_id) / 1024**3  # GB
+            memory_total = self._total_mem_gb  # GB
             
             return {
                 'gpu_memory_used': memory_used,
@@ -281,42 +684,50 @@ class GPUAcceleratedProcessor:
             
     def get_performance_stats(self) -> dict:
         """获取性能统计"""
+        # 汇总前取回尚未读取的CUDA事件耗时（统计路径，可以等待）
+        for timer in (self.preprocess_timer, self.postprocess_timer):
+            if timer is not None:
+                timer.collect(wait=True)
+        
         stats = self.stats.copy()
         
         # 计算平均时间
         if stats['gpu_preprocessing_time']:
-            stats['avg_preprocessing_time'] = np.mean(stats['gpu_preprocessing_time'])
-            stats['max_preprocessing_time'] = np.max(stats['gpu_preprocessing_time'])
+            stats['avg_preprocessing_time'] = stats['gpu_preprocessing_time'].mean()
+            stats['max_preprocessing_time'] = stats['gpu_preprocessing_time'].max()
             
         if stats['gpu_postprocessing_time']:
-            stats['avg_postprocessing_time'] = np.mean(stats['gpu_postprocessing_time'])
-            stats['max_postprocessing_time'] = np.max(stats['gpu_postprocessing_time'])
-            
-        # 缓存命中率
-        total_requests = stats['cache_hits'] + stats['cache_misses']
-        if total_requests > 0:
-            stats['cache_hit_rate'] = stats['cache_hits'] / total_requests * 100
-        else:
-            stats['cache_hit_rate'] = 0
+            stats['avg_postprocessing_time'] = stats['gpu_postprocessing_time'].mean()
+            stats['max_postprocessing_time'] = stats['gpu_postprocessing_time'].max()
             
         return stats
         
-    def cleanup(self):
-        """清理GPU资源"""
+    def cleanup(self, final: bool = True):
+        """
+        清理GPU资源
+        
+        Args:
+            final: 为True时（程序退出）释放所有缓冲区并归还缓存显存；
+                   为False时（如重新加载配置）只清空统计信息，保留已分配的缓冲区，
+                   避免 empty_cache 的设备同步和之后重新cudaMalloc的开销
+        """
         try:
-            # 清空内存池
-            for key in self.memory_pool:
-                del self.memory_pool[key]
-            self.memory_pool.clear()
-            self.pool_usage.clear()
-            
-            # 强制GPU垃圾回收
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
+            if final:
+                # 释放内存池、CUDA Graph和锁页内存
+                self.graphs.clear()
+                self.graph_index.clear()
+                self.mem_pool = None
+                self._det_out = None
+                self.pinned_buffers.clear()
+                self.pinned_index.clear()
+                
+                # 强制GPU垃圾回收
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
                 
             # 清空统计信息
             for key in self.stats:
-                if isinstance(self.stats[key], list):
+                if isinstance(self.stats[key], TimingWindow):
                     self.stats[key].clear()
                 else:
                     self.stats[key] = 0
@@ -363,7 +774,7 @@ if __name__ == "__main__":
     
     # 获取性能统计
     stats = processor.get_performance_stats()
-    print(f"[INFO] 缓存命中率: {stats['cache_hit_rate']:.1f}%")
+    print(f"[INFO] 平均预处理时间: {stats['avg_preprocessing_time']*1000:.2f}ms")
     
     # 获取内存使用
     memory = processor.get_memory_usage()
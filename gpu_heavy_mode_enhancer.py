@@ -7,24 +7,60 @@ GPU重度模式增强器
 
 import json
 import os
+
+from unified_memory_config import ALLOCATOR_CONF
+
+# PyTorch CUDA缓存分配器配置必须在 torch 初始化CUDA之前设置才会生效；用户已设置时不覆盖。
+# 这里的 setdefault 只作用于本工具进程；主程序启动时由 unified_memory_config 读取写入配置的 allocator_conf
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", ALLOCATOR_CONF)
+
 import torch
 import psutil
-import GPUtil
 from typing import Dict, Any
 
+# 直接调用NVML C接口查询GPU状态（GPUtil每次都要启动nvidia-smi子进程）
+try:
+    import pynvml
+    PYNVML_AVAILABLE = True
+except ImportError:
+    PYNVML_AVAILABLE = False
+    print("[WARNING] pynvml不可用，无法获取GPU使用率信息")
+
+# orjson 直接读写bytes，比标准库json快数倍；不可用时回退到json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 class GPUHeavyModeEnhancer:
     """GPU重度模式增强器"""
     
     def __init__(self):
         self.config_file = "gui_config.json"
         self.current_config = self.load_current_config()
+        self.nvml_handles = self._init_nvml_handles()
+        
+    def _init_nvml_handles(self) -> list:
+        """初始化NVML并缓存各GPU的设备句柄"""
+        if not PYNVML_AVAILABLE:
+            return []
+        try:
+            pynvml.nvmlInit()
+            return [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+        except Exception as e:
+            print(f"[WARNING] NVML初始化失败: {e}")
+            return []
         
     def load_current_config(self) -> Dict[str, Any]:
         """加载当前配置"""
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                with open(self.config_file, "rb") as f:
+                    data = f.read()
+                if ORJSON_AVAILABLE:
+                    return orjson.loads(data)
+                return json.loads(data.decode("utf-8"))
             return {}
         except Exception as e:
             print(f"[ERROR] 配置加载失败: {e}")
@@ -45,25 +81,30 @@ class GPUHeavyModeEnhancer:
             analysis['gpu_count'] = torch.cuda.device_count()
             
             try:
-                gpus = GPUtil.getGPUs()
-                for i, gpu in enumerate(gpus):
+                for i, handle in enumerate(self.nvml_handles):
+                    name = pynvml.nvmlDeviceGetName(handle)
+                    if isinstance(name, bytes):
+                        name = name.decode('utf-8')
+                    utilization = pynvml.nvmlDeviceGetUtilizationRates(handle).gpu
+                    mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                    memory_util = mem.used / mem.total * 100 if mem.total else 0.0
                     gpu_info = {
                         'id': i,
-                        'name': gpu.name,
-                        'utilization': gpu.load * 100,
-                        'memory_used': gpu.memoryUsed,
-                        'memory_total': gpu.memoryTotal,
-                        'memory_util': gpu.memoryUtil * 100,
-                        'temperature': gpu.temperature
+                        'name': name,
+                        'utilization': float(utilization),
+                        'memory_used': mem.used / 1024**2,  # MB
+                        'memory_total': mem.total / 1024**2,  # MB
+                        'memory_util': memory_util,
+                        'temperature': pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
                     }
                     analysis['gpu_info'].append(gpu_info)
                     
                     # 识别瓶颈
-                    if gpu.load < 0.5:  # GPU使用率低于50%
-                        analysis['bottlenecks'].append(f"GPU {i} 使用率过低: {gpu.load*100:.1f}%")
+                    if utilization < 50:  # GPU使用率低于50%
+                        analysis['bottlenecks'].append(f"GPU {i} 使用率过低: {utilization:.1f}%")
                     
-                    if gpu.memoryUtil < 0.3:  # 显存使用率低于30%
-                        analysis['bottlenecks'].append(f"GPU {i} 显存利用率低: {gpu.memoryUtil*100:.1f}%")
+                    if memory_util < 30:  # 显存使用率低于30%
+                        analysis['bottlenecks'].append(f"GPU {i} 显存利用率低: {memory_util:.1f}%")
                         
             except Exception as e:
                 print(f"[WARNING] GPU信息获取失败: {e}")
@@ -92,7 +133,10 @@ class GPUHeavyModeEnhancer:
             "performance_monitoring": True,
             "memory_pool_preallocation": True,
             "zero_copy_optimization": True,
-            "debug_unified_memory": False
+            "debug_unified_memory": False,
+            # 写入 gui_config.json 的 unified_memory 段，主程序启动时在导入torch前设置为
+            # PYTORCH_CUDA_ALLOC_CONF（见 unified_memory_config.apply_saved_allocator_conf）
+            "allocator_conf": ALLOCATOR_CONF
         }
         
         # 根据分析结果调整配置
@@ -153,9 +197,16 @@ class GPUHeavyModeEnhancer:
             else:
                 self.current_config["unified_memory"] = enhanced_config
             
-            # 保存配置
-            with open(self.config_file, "w", encoding="utf-8") as f:
-                json.dump(self.current_config, f, indent=2, ensure_ascii=False)
+            # 保存配置：先完整写入临时文件再原子替换，崩溃时不会留下截断的配置文件
+            if ORJSON_AVAILABLE:
+                data = orjson.dumps(self.current_config, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            else:
+                data = json.dumps(self.current_config, indent=2, ensure_ascii=False).encode("utf-8")
+            
+            tmp_file = self.config_file + ".tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, self.config_file)
             
             print(f"[SUCCESS] ✅ 配置已更新到 {self.config_file}")
             return True
@@ -176,7 +227,7 @@ class GPUHeavyModeEnhancer:
             gpu = analysis['gpu_info'][0]
             print(f"  • GPU: {gpu['name']}")
             print(f"  • GPU使用率: {gpu['utilization']:.1f}% ⚠️ {'过低' if gpu['utilization'] < 30 else '正常'}")
-            print(f"  • 显存使用: {gpu['memory_used']}MB / {gpu['memory_total']}MB ({gpu['memory_util']:.1f}%)")
+            print(f"  • 显存使用: {gpu['memory_used']:.0f}MB / {gpu['memory_total']:.0f}MB ({gpu['memory_util']:.1f}%)")
             print(f"  • GPU温度: {gpu['temperature']}°C")
         
         memory = analysis['system_memory']
@@ -193,6 +244,7 @@ class GPUHeavyModeEnhancer:
         print(f"\n⚙️ 增强配置:")
         print(f"  • 统一内存大小: {enhanced_config.get('unified_memory_size_gb', 'N/A')}GB")
         print(f"  • 优化级别: {enhanced_config.get('memory_optimization_level', 'N/A')}")
+        print(f"  • 分配器配置: {enhanced_config.get('allocator_conf', 'N/A')}")
         print(f"  • GPU管道优化: {'✅' if enhanced_config.get('gpu_pipeline_optimization') else '❌'}")
         print(f"  • 异步GPU处理: {'✅' if enhanced_config.get('async_gpu_processing') else '❌'}")
         print(f"  • GPU预处理: {'✅' if enhanced_config.get('enable_gpu_preprocessing') else '❌'}")
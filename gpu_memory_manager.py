@@ -6,42 +6,286 @@ GPU内存管理器
 解决内存不足问题，提高GPU利用率
 """
 
+import os
 import torch
 import numpy as np
 import time
 import gc
+import contextlib
+import math
+import logging
 from typing import Dict, List, Tuple, Optional, Any
-from collections import defaultdict
+from collections import OrderedDict, Counter
 import threading
+import bisect
 import psutil
+from unified_memory_config import get_memory_limit_gb
+
+# 运行期（分配/清理路径）的消息走 logging，避免内存紧张时大量 print 阻塞推理线程
+logger = logging.getLogger(__name__)
+
+# 相同的紧急路径消息在该时间窗口（秒）内只记录一次
+LOG_THROTTLE_SECONDS = 1.0
+_last_logged = {}
+
+def _log_throttled(level: int, msg: str, *args):
+    """按消息模板和参数限流记录日志"""
+    if not logger.isEnabledFor(level):
+        return
+    key = (msg, args)
+    now = time.monotonic()
+    if now - _last_logged.get(key, 0.0) < LOG_THROTTLE_SECONDS:
+        return
+    _last_logged[key] = now
+    logger.log(level, msg, *args)
+
+# 内存池分桶粒度（同PyTorch CUDACachingAllocator）：小于1MiB按512B取整，其余按2MiB取整
+SMALL_BLOCK_BYTES = 1 << 20
+SMALL_ROUND_BYTES = 512
+LARGE_ROUND_BYTES = 2 << 20
+
+def round_bucket_bytes(nbytes: int) -> int:
+    """把请求字节数向上取整到分桶大小"""
+    if nbytes < SMALL_BLOCK_BYTES:
+        return (nbytes + SMALL_ROUND_BYTES - 1) & ~(SMALL_ROUND_BYTES - 1)
+    return (nbytes + LARGE_ROUND_BYTES - 1) & ~(LARGE_ROUND_BYTES - 1)
+
+# 每个设备预留的显存块（slab）：小块(<1MiB)与大块分开管理；大块slab不超过内存池大小
+SMALL_SLAB_BYTES = 64 << 20
+LARGE_SLAB_BYTES = 512 << 20
+
+# 所有内存池/共享内存分配放进独立的 torch.cuda.MemPool，与cuDNN工作区等分开；
+# 设置环境变量 GPU_MEMORY_MANAGER_MEMPOOL=0 可退回默认分配器
+USE_PRIVATE_MEM_POOL = os.environ.get("GPU_MEMORY_MANAGER_MEMPOOL", "1") != "0"
+
+# zero_copy_transfer 每个线程保留的锁页暂存缓冲区数量（按形状/类型LRU淘汰）
+PINNED_STAGING_CAPACITY = 4
+
+# push_frame 环形缓冲区的槽位数：生产者上传下一帧时消费者仍可读取之前的帧
+FRAME_RING_SIZE = 4
+
+# 集成GPU（Jetson/Tegra等）上注册为映射内存的numpy缓冲区上限，超出后按LRU注销
+MAPPED_HOST_CACHE_SIZE = 8
+CUDA_HOST_REGISTER_MAPPED = 2  # cudaHostRegisterMapped
+
+# 只释放本管理器的空闲块后，缓存分配器中空闲的保留显存仍超过该值才调用 empty_cache（会同步整个设备）
+EMPTY_CACHE_THRESHOLD_BYTES = 256 << 20
+
+# batch_allocate 中各张量在同一块显存内的起始地址对齐（字节）
+BATCH_ALIGN_BYTES = 256
+
+# 命名共享内存区域所在的arena大小：各区域在其中顺序分配，首地址按 BATCH_ALIGN_BYTES 对齐
+SHARED_ARENA_BYTES = 256 << 20
+
+# capture_graph 捕获前在侧流上预热的次数（让cuDNN/cuBLAS完成算法选择和工作区分配）
+GRAPH_WARMUP_ITERS = 3
+
+# 检测结果量化：置信度按 1/255 存为uint8
+DETECTION_CONF_SCALE = 255
+
+# get_memory_usage 结果缓存时间（秒），按帧轮询时不必每次都查询系统/驱动
+MEMORY_USAGE_TTL = 0.1
+
+# optimize_memory_layout 按 频率×字节数 选取的预分配分桶数量
+PROFILED_PREALLOC_TOP_K = 8
+
+class _CudaArrayView:
+    """用 __cuda_array_interface__ 把设备可访问的指针包装给 torch.as_tensor（不拷贝）"""
+    
+    def __init__(self, ptr: int, shape: Tuple, dtype: np.dtype):
+        self.__cuda_array_interface__ = {
+            'shape': tuple(shape),
+            'typestr': dtype.str,
+            'data': (ptr, False),
+            'version': 3,
+        }
+
+# 常用dtype的字节数，统计/分桶时直接查表
+_DTYPE_BYTES = {
+    torch.float16: 2,
+    torch.bfloat16: 2,
+    torch.float32: 4,
+    torch.int8: 1,
+    torch.uint8: 1,
+}
+
+def _dtype_bytes(dtype) -> int:
+    """dtype的字节数"""
+    nbytes = _DTYPE_BYTES.get(dtype)
+    return nbytes if nbytes is not None else torch.empty((), dtype=dtype).element_size()
+
+class SlabAllocator:
+    """在一整块预留显存上做best-fit分配：大块拆分使用，释放时与相邻空闲块合并"""
+    
+    def __init__(self, capacity: int, device: str):
+        self.slab = torch.empty(capacity, dtype=torch.uint8, device=device)
+        self.base_ptr = self.slab.data_ptr()
+        self.capacity = capacity
+        # 空闲块：按偏移排序的列表 + 偏移到大小的映射
+        self.free_offsets = [0]
+        self.free_sizes = {0: capacity}
+        # 已分配块：偏移 -> 大小
+        self.allocated = {}
+        
+    def owns(self, tensor: torch.Tensor) -> bool:
+        """张量是否切自本slab"""
+        return self.base_ptr <= tensor.data_ptr() < self.base_ptr + self.capacity
+        
+    def allocate(self, nbytes: int, dtype) -> Optional[torch.Tensor]:
+        """best-fit分配nbytes字节，返回一维dtype张量；没有足够大的空闲块时返回None"""
+        best_offset = None
+        best_size = 0
+        for offset in self.free_offsets:
+            size = self.free_sizes[offset]
+            if size >= nbytes and (best_offset is None or size < best_size):
+                best_offset, best_size = offset, size
+                if size == nbytes:
+                    break
+        if best_offset is None:
+            return None
+        
+        # 拆分：剩余部分作为新的空闲块
+        self.free_offsets.remove(best_offset)
+        del self.free_sizes[best_offset]
+        if best_size > nbytes:
+            remainder = best_offset + nbytes
+            bisect.insort(self.free_offsets, remainder)
+            self.free_sizes[remainder] = best_size - nbytes
+        
+        self.allocated[best_offset] = nbytes
+        return self.slab[best_offset:best_offset + nbytes].view(dtype)
+        
+    def free(self, tensor: torch.Tensor):
+        """归还切自本slab的块，并与前后相邻的空闲块合并"""
+        offset = tensor.data_ptr() - self.base_ptr
+        size = self.allocated.pop(offset, None)
+        if size is None:
+            return
+        
+        # 合并后一个空闲块
+        next_offset = offset + size
+        if next_offset in self.free_sizes:
+            size += self.free_sizes.pop(next_offset)
+            self.free_offsets.remove(next_offset)
+        
+        # 合并前一个空闲块
+        index = bisect.bisect_left(self.free_offsets, offset)
+        if index > 0:
+            prev_offset = self.free_offsets[index - 1]
+            if prev_offset + self.free_sizes[prev_offset] == offset:
+                self.free_sizes[prev_offset] += size
+                return
+        
+        self.free_offsets.insert(index, offset)
+        self.free_sizes[offset] = size
+        
+    def largest_free_block(self) -> int:
+        """最大空闲块字节数"""
+        return max(self.free_sizes.values(), default=0)
+
+class PinnedRing:
+    """截图帧上传用的环形缓冲区：N个锁页暂存槽位 + N个对应的GPU槽位"""
+    
+    def __init__(self, shape: Tuple, dtype: np.dtype, device: str, stream: torch.cuda.Stream,
+                 size: int = FRAME_RING_SIZE):
+        self.device = device
+        self.stream = stream
+        self.slots = [torch.from_numpy(np.empty(shape, dtype=dtype)).pin_memory() for _ in range(size)]
+        self.gpu = [torch.empty(shape, dtype=slot.dtype, device=device) for slot in self.slots]
+        # 传输完成事件 / 消费者读完该槽位的标记
+        self.events = [torch.cuda.Event() for _ in range(size)]
+        self.consumed = [None] * size
+        self.index = -1
+        
+    def push(self, frame: np.ndarray) -> Tuple[torch.Tensor, torch.cuda.Event]:
+        """上传一帧到下一个槽位，返回 (GPU张量, 传输完成事件)"""
+        consumer = torch.cuda.current_stream(self.device)
+        if self.index >= 0:
+            # 上一帧的消费工作已在消费流上排队，记录标记以便复用该槽位前等待
+            mark = torch.cuda.Event()
+            mark.record(consumer)
+            self.consumed[self.index] = mark
+        
+        self.index = (self.index + 1) % len(self.slots)
+        i = self.index
+        
+        # 最旧的槽位：上一次从它发出的传输完成后才能覆盖锁页内存
+        self.events[i].synchronize()
+        np.copyto(self.slots[i].numpy(), frame, casting='no')
+        
+        with torch.cuda.stream(self.stream):
+            if self.consumed[i] is not None:
+                self.stream.wait_event(self.consumed[i])
+            self.gpu[i].copy_(self.slots[i], non_blocking=True)
+            self.events[i].record(self.stream)
+        return self.gpu[i], self.events[i]
 
 class GPUMemoryManager:
     """GPU内存管理器 - 实现共享GPU内存和内存池"""
     
-    def __init__(self, device_ids: List[int] = [0], pool_size_gb: float = 4.0):
+    def __init__(self, device_ids: List[int] = [0], pool_size_gb: float = 4.0,
+                 memory_limit_gb: Optional[float] = None):
         """
         初始化GPU内存管理器
         
         Args:
             device_ids: GPU设备ID列表
             pool_size_gb: 内存池大小(GB)
+            memory_limit_gb: 本进程显存上限(GB)；None 时读取 gui_config.json 中
+                             unified_memory.memory_limit_gb，未配置时不设上限
         """
         self.device_ids = device_ids
         self.pool_size_bytes = int(pool_size_gb * 1024**3)
+        if memory_limit_gb is None:
+            memory_limit_gb = get_memory_limit_gb()
+        self.memory_limit_bytes = int(memory_limit_gb * 1024**3) if memory_limit_gb else None
         self.devices = [f'cuda:{i}' for i in device_ids if torch.cuda.is_available()]
         
         if not self.devices:
             self.devices = ['cpu']
             print("[WARNING] 无可用GPU，使用CPU模式")
+        # 默认设备只解析一次
+        self._default_device = self.devices[0]
         
-        # 内存池 - 每个设备一个池
+        # 内存池 - 每个设备一个池：(分桶字节数, dtype) -> [(空闲的一维缓冲区, 最后使用事件), ...]
         self.memory_pools = {}
+        # 已借出的缓冲区：data_ptr -> ((分桶字节数, dtype), 一维缓冲区)
         self.pool_usage = {}
+        # pool_locks 只保护slab和内存池结构；空闲列表的借还按 (分桶字节数, dtype) 分片加锁
         self.pool_locks = {}
+        self._bucket_locks = {}
+        # 每个设备的slab分配器：'small' / 'large'，首次 allocate_tensor 时才创建
+        self.slabs = {}
+        # 每个设备的私有 torch.cuda.MemPool
+        self._pools = {}
+        
+        # 零拷贝传输：每个线程的锁页暂存缓冲区 (shape, dtype) -> (锁页张量, 完成事件)，
+        # 以及每个设备专用的主机到显存传输流
+        self._staging_local = threading.local()
+        self._h2d_streams = {}
+        # push_frame 的环形缓冲区：(device, shape, dtype) -> PinnedRing
+        self._frame_rings = {}
+        
+        # 实际分配画像：device -> Counter[(分桶字节数, dtype)]，用于重建预分配集合
+        self._alloc_histogram = {}
+        
+        # capture_graph 捕获的图共享每个设备一个图内存池，保持图的内存布局稳定
+        self._graph_pools = {}
+        self._graphs = []
+        
+        # get_memory_usage 缓存：(刷新时间, 结果)
+        self._usage_cache = (0.0, {})
         
-        # 共享内存区域
+        # 集成GPU与CPU共享物理内存：numpy缓冲区注册为映射内存后GPU可直接访问，无需拷贝
+        self.integrated_devices = set()
+        # 已注册的主机指针：ptr -> numpy数组（保持引用，注销前不能被释放）
+        self._mapped_host = OrderedDict()
+        
+        # 共享内存区域：名称 -> 张量（arena中的视图）
         self.shared_memory = {}
         self.shared_locks = {}
+        self._shared_arena = {}
+        self._shared_offset = {}
         
         # 统计信息
         self.stats = {
@@ -50,9 +294,13 @@ class GPUMemoryManager:
             'cache_hits': 0,
             'cache_misses': 0,
             'memory_saved_bytes': 0,
-            'peak_memory_usage': 0
+            'peak_memory_usage': 0,
+            'slab_fallbacks': 0
         }
         
+        # 用PyTorch分配器本身限制本进程的显存上限
+        self._apply_memory_fraction()
+        
         # 初始化内存池
         self._initialize_memory_pools()
         
@@ -60,18 +308,44 @@ class GPUMemoryManager:
         print(f"[INFO] 设备: {self.devices}")
         print(f"[INFO] 内存池大小: {pool_size_gb:.1f}GB")
         
-    def _initialize_memory_pools(self):
-        """初始化内存池"""
+    def _apply_memory_fraction(self):
+        """按显存上限设置每个设备的 set_per_process_memory_fraction（有上限且小于总显存时）"""
+        if self.memory_limit_bytes is None:
+            return
         for device in self.devices:
             if device == 'cpu':
                 continue
+            try:
+                device_id = int(device.split(':')[1])
+                total = torch.cuda.get_device_properties(device_id).total_memory
+                if self.memory_limit_bytes < total:
+                    torch.cuda.set_per_process_memory_fraction(self.memory_limit_bytes / total, device_id)
+                    print(f"[INFO] {device} 显存上限: {self.memory_limit_bytes / 1024**3:.1f}GB / {total / 1024**3:.1f}GB")
+            except Exception as e:
+                print(f"[WARNING] {device} 显存上限设置失败: {e}")
+                
+    def _initialize_memory_pools(self):
+        """初始化内存池（可重复调用，已初始化的设备保留现有缓冲区）"""
+        for device in self.devices:
+            if device == 'cpu' or device in self.memory_pools:
+                continue
                 
             try:
                 self.memory_pools[device] = {}
                 self.pool_usage[device] = {}
                 self.pool_locks[device] = threading.Lock()
+                self._bucket_locks[device] = {}
+                self._alloc_histogram[device] = Counter()
                 self.shared_memory[device] = {}
                 self.shared_locks[device] = threading.Lock()
+                if getattr(torch.cuda.get_device_properties(device), 'is_integrated', False):
+                    self.integrated_devices.add(device)
+                    print(f"[INFO] {device} 为集成GPU，zero_copy_transfer 使用映射主机内存")
+                if USE_PRIVATE_MEM_POOL and hasattr(torch.cuda, 'MemPool'):
+                    self._pools[device] = torch.cuda.MemPool()
+                # slab和共享内存arena在私有内存池中无法被 empty_cache 释放，
+                # 只有真正使用 allocate_tensor / 共享内存时才预留（见 _ensure_slabs、_carve_shared）
+                self._shared_offset[device] = 0
                 
                 # 预分配常用尺寸的内存块
                 common_sizes = [
@@ -90,19 +364,125 @@ class GPUMemoryManager:
             except Exception as e:
                 print(f"[WARNING] {device} 内存池初始化失败: {e}")
                 
+    def _use_pool(self, device: str):
+        """在该设备的私有内存池中分配的上下文（未启用时为空上下文）"""
+        pool = self._pools.get(device)
+        if pool is None:
+            return contextlib.nullcontext()
+        return torch.cuda.memory.use_mem_pool(pool, device=device)
+        
+    def _ensure_slabs(self, device: str):
+        """首次分配时为该设备预留小块/大块slab"""
+        if device in self.slabs:
+            return
+        with self.pool_locks[device]:
+            if device in self.slabs:
+                return
+            try:
+                with self._use_pool(device):
+                    self.slabs[device] = {
+                        'small': SlabAllocator(SMALL_SLAB_BYTES, device),
+                        'large': SlabAllocator(min(self.pool_size_bytes, LARGE_SLAB_BYTES), device),
+                    }
+            except torch.cuda.OutOfMemoryError:
+                # 预留失败时不使用slab，分配直接走缓存分配器
+                self.slabs[device] = {}
+                logger.warning("%s slab预留失败，直接使用缓存分配器", device)
+        
+    def _slab_for(self, device: str, bucket: int) -> Optional[SlabAllocator]:
+        """按分桶大小选择小块/大块slab"""
+        slabs = self.slabs.get(device)
+        if not slabs:
+            return None
+        return slabs['small'] if bucket < SMALL_BLOCK_BYTES else slabs['large']
+        
+    def _new_bucket_buffer(self, bucket: int, dtype, device: str) -> torch.Tensor:
+        """分配一个分桶大小的一维缓冲区：优先从slab中切分，slab不足时才走cudaMalloc"""
+        slab = self._slab_for(device, bucket)
+        if slab is not None:
+            with self.pool_locks[device]:
+                buffer = slab.allocate(bucket, dtype)
+            if buffer is not None:
+                return buffer
+            self.stats['slab_fallbacks'] += 1
+        with self._use_pool(device):
+            return torch.empty(bucket // _dtype_bytes(dtype), dtype=dtype, device=device)
+        
+    def _bucket_lock(self, device: str, key: Tuple) -> threading.Lock:
+        """获取分桶的锁；新分桶的锁在结构锁下创建"""
+        locks = self._bucket_locks[device]
+        lock = locks.get(key)
+        if lock is None:
+            with self.pool_locks[device]:
+                lock = locks.setdefault(key, threading.Lock())
+        return lock
+        
+    def _free_list(self, device: str, key: Tuple) -> List[Tuple[torch.Tensor, Optional[torch.cuda.Event]]]:
+        """获取分桶的空闲列表（调用方持有分桶锁）"""
+        pool = self.memory_pools[device]
+        free_list = pool.get(key)
+        if free_list is None:
+            free_list = pool.setdefault(key, [])
+        return free_list
+        
+    def _release_buffer(self, device: str, buffer: torch.Tensor):
+        """把空闲缓冲区还给slab（调用方持有锁）；不属于slab的缓冲区直接丢弃"""
+        for slab in self.slabs.get(device, {}).values():
+            if slab.owns(buffer):
+                slab.free(buffer)
+                return
+                
+    def _release_free_buffers(self, device: str, keep_ratio: float = 0.0):
+        """释放内存池中的空闲缓冲区（调用方持有结构锁），每个分桶保留 keep_ratio 比例"""
+        for key, free_list in list(self.memory_pools[device].items()):
+            with self._bucket_locks[device][key]:
+                release_count = len(free_list) - int(len(free_list) * keep_ratio)
+                # 仍被其他流上排队的kernel使用的缓冲区不能交还slab，留到下次
+                released, pending = [], []
+                for entry in free_list[:release_count]:
+                    if entry[1] is None or entry[1].query():
+                        released.append(entry)
+                    else:
+                        pending.append(entry)
+                free_list[:release_count] = pending
+            for buffer, _ in released:
+                self._release_buffer(device, buffer)
+        
     def _preallocate_buffer(self, device: str, size: Tuple, dtype=torch.float16):
         """预分配内存缓冲区"""
         try:
-            key = f"{size}_{dtype}"
-            buffer = torch.empty(size, dtype=dtype, device=device)
-            
-            with self.pool_locks[device]:
-                self.memory_pools[device][key] = buffer
-                self.pool_usage[device][key] = False
+            bucket = round_bucket_bytes(math.prod(size) * _dtype_bytes(dtype))
+            self._preallocate_bucket(device, (bucket, dtype))
                 
         except Exception as e:
             print(f"[WARNING] 预分配缓冲区失败 {device} {size}: {e}")
             
+    def _preallocate_bucket(self, device: str, key: Tuple):
+        """为分桶预分配一个空闲缓冲区"""
+        buffer = self._new_bucket_buffer(key[0], key[1], device)
+        with self._bucket_lock(device, key):
+            self._free_list(device, key).append((buffer, None))
+            
+    def _prefetch_profiled_buffers(self, device: str):
+        """按实际分配画像预分配：频率×字节数最高的分桶保证至少有一个空闲缓冲区"""
+        histogram = self._alloc_histogram[device]
+        ranked = sorted(histogram.items(), key=lambda item: item[1] * item[0][0], reverse=True)
+        
+        prefetched = 0
+        for key, _ in ranked[:PROFILED_PREALLOC_TOP_K]:
+            if not self.memory_pools[device].get(key):
+                self._preallocate_bucket(device, key)
+                prefetched += 1
+        
+        # 计数减半，让画像跟随近期负载变化
+        for key in list(histogram):
+            histogram[key] //= 2
+            if not histogram[key]:
+                del histogram[key]
+        
+        if prefetched:
+            logger.info("%s 按分配画像预分配%d个缓冲区", device, prefetched)
+            
     def allocate_tensor(self, size: Tuple, dtype=torch.float16, device: str = None) -> torch.Tensor:
         """
         分配GPU张量（支持内存池复用）
@@ -116,45 +496,67 @@ class GPUMemoryManager:
             GPU张量
         """
         if device is None:
-            device = self.devices[0]
-            
-        key = f"{size}_{dtype}"
+            device = self._default_device
+        return self._allocate_raw(size, dtype, device)
         
-        # 尝试从内存池获取
-        if device in self.memory_pools:
-            with self.pool_locks[device]:
-                if key in self.memory_pools[device] and not self.pool_usage[device].get(key, True):
-                    self.pool_usage[device][key] = True
-                    self.stats['cache_hits'] += 1
-                    self.stats['memory_saved_bytes'] += torch.tensor(size).prod().item() * dtype.itemsize if hasattr(dtype, 'itemsize') else 4
-                    return self.memory_pools[device][key]
+    def _allocate_raw(self, size: Tuple, dtype, device: str) -> torch.Tensor:
+        """allocate_tensor 的实现（device 已确定）"""
+        if device not in self.memory_pools:
+            return torch.empty(size, dtype=dtype, device=device)
         
-        # 创建新张量
-        try:
-            tensor = torch.empty(size, dtype=dtype, device=device)
+        self._ensure_slabs(device)
+        numel = math.prod(size)
+        nbytes = numel * _dtype_bytes(dtype)
+        key = (round_bucket_bytes(nbytes), dtype)
+        self._alloc_histogram[device][key] += 1
+        
+        # 尝试从内存池获取：同一分桶内任意形状都可复用，只锁该分桶
+        with self._bucket_lock(device, key):
+            free_list = self.memory_pools[device].get(key)
+            buffer, last_event = free_list.pop() if free_list else (None, None)
+        
+        if buffer is not None:
+            if last_event is not None and not last_event.query():
+                # 上一个使用者的kernel还在其他流上排队：当前流在GPU上等待它完成，不阻塞主机
+                torch.cuda.current_stream(device).wait_event(last_event)
+            self.stats['cache_hits'] += 1
+            self.stats['memory_saved_bytes'] += nbytes
+        else:
+            # 创建新的分桶缓冲区，释放后可以回到内存池
+            try:
+                buffer = self._new_bucket_buffer(key[0], dtype, device)
+            except torch.cuda.OutOfMemoryError:
+                # 内存不足时清理并重试
+                self._emergency_cleanup(device)
+                buffer = self._new_bucket_buffer(key[0], dtype, device)
             self.stats['allocations'] += 1
             self.stats['cache_misses'] += 1
-            return tensor
-        except torch.cuda.OutOfMemoryError:
-            # 内存不足时清理并重试
-            self._emergency_cleanup(device)
-            return torch.empty(size, dtype=dtype, device=device)
+        
+        # 单次字典写入在GIL下是原子的，无需加锁
+        self.pool_usage[device][buffer.data_ptr()] = (key, buffer)
+        
+        # 切片+view：不分配也不拷贝；记录所属设备，释放时无需再解析 tensor.device
+        tensor = buffer[:numel].view(size)
+        tensor._pool_device = device
+        return tensor
             
     def deallocate_tensor(self, tensor: torch.Tensor):
         """释放张量（返回内存池）"""
-        if not tensor.is_cuda:
+        device = getattr(tensor, '_pool_device', None)
+        if device is None:
             return
-            
-        device = str(tensor.device)
-        size = tuple(tensor.shape)
-        dtype = tensor.dtype
-        key = f"{size}_{dtype}"
         
         # 返回内存池
-        if device in self.pool_usage and key in self.pool_usage[device]:
-            with self.pool_locks[device]:
-                self.pool_usage[device][key] = False
-                self.stats['deallocations'] += 1
+        entry = self.pool_usage[device].pop(tensor.data_ptr(), None)
+        if entry is None:
+            return
+        key, buffer = entry
+        # 记录释放时刻当前流上的进度，复用前据此排序，避免跨流读写冲突
+        last_event = torch.cuda.Event()
+        last_event.record(torch.cuda.current_stream(device))
+        with self._bucket_lock(device, key):
+            self._free_list(device, key).append((buffer, last_event))
+        self.stats['deallocations'] += 1
                 
     def create_shared_memory(self, name: str, size: Tuple, dtype=torch.float16, device: str = None) -> torch.Tensor:
         """
@@ -170,22 +572,71 @@ class GPUMemoryManager:
             共享内存张量
         """
         if device is None:
-            device = self.devices[0]
+            device = self._default_device
             
         if device not in self.shared_memory:
             return self.allocate_tensor(size, dtype, device)
             
         with self.shared_locks[device]:
             if name not in self.shared_memory[device]:
-                self.shared_memory[device][name] = torch.empty(size, dtype=dtype, device=device)
-                print(f"[INFO] 🔗 创建共享内存区域: {name} on {device}")
+                self.shared_memory[device][name] = self._carve_shared(device, size, dtype)
+                logger.info("创建共享内存区域: %s on %s", name, device)
                 
             return self.shared_memory[device][name]
             
+    def _carve_shared(self, device: str, size: Tuple, dtype) -> torch.Tensor:
+        """在共享内存arena中顺序分配一个区域（调用方持有共享锁）；arena首次使用时才创建，用尽时回退到 torch.empty"""
+        nbytes = math.prod(size) * _dtype_bytes(dtype)
+        start = self._shared_offset.get(device, 0)
+        arena = self._shared_arena.get(device)
+        if arena is None and nbytes <= SHARED_ARENA_BYTES:
+            with self._use_pool(device):
+                arena = self._shared_arena[device] = torch.empty(SHARED_ARENA_BYTES, dtype=torch.uint8, device=device)
+            start = 0
+        if arena is None or start + nbytes > arena.numel():
+            logger.warning("%s 共享内存arena已满，%.1fMB 区域单独分配", device, nbytes / 1024**2)
+            with self._use_pool(device):
+                return torch.empty(size, dtype=dtype, device=device)
+        
+        self._shared_offset[device] = (start + nbytes + BATCH_ALIGN_BYTES - 1) & ~(BATCH_ALIGN_BYTES - 1)
+        return arena[start:start + nbytes].view(dtype).view(size)
+        
+    def allocate_detection_buffer(self, max_det: int = 100, device: str = None) -> Dict[str, torch.Tensor]:
+        """
+        分配量化的检测结果缓冲区（结构数组，三段在共享内存arena中相邻）
+        
+        Returns:
+            {'xyxy': (max_det, 4) int16, 'conf': (max_det,) uint8（× 1/DETECTION_CONF_SCALE）, 'cls': (max_det,) uint8}
+        """
+        if device is None:
+            device = self._default_device
+        
+        if device not in self.shared_memory:
+            return {
+                'xyxy': torch.empty((max_det, 4), dtype=torch.int16, device=device),
+                'conf': torch.empty((max_det,), dtype=torch.uint8, device=device),
+                'cls': torch.empty((max_det,), dtype=torch.uint8, device=device),
+            }
+        
+        with self.shared_locks[device]:
+            return {
+                'xyxy': self._carve_shared(device, (max_det, 4), torch.int16),
+                'conf': self._carve_shared(device, (max_det,), torch.uint8),
+                'cls': self._carve_shared(device, (max_det,), torch.uint8),
+            }
+            
+    def pack_detections(self, detections: torch.Tensor, buffer: Dict[str, torch.Tensor]) -> int:
+        """把 (N, 6) 的 [x1, y1, x2, y2, conf, cls] 检测结果量化写入检测缓冲区，返回写入的数量"""
+        n = min(detections.shape[0], buffer['xyxy'].shape[0])
+        buffer['xyxy'][:n].copy_(detections[:n, :4].round())
+        buffer['conf'][:n].copy_((detections[:n, 4] * DETECTION_CONF_SCALE).round())
+        buffer['cls'][:n].copy_(detections[:n, 5])
+        return n
+        
     def get_shared_memory(self, name: str, device: str = None) -> Optional[torch.Tensor]:
         """获取共享内存区域"""
         if device is None:
-            device = self.devices[0]
+            device = self._default_device
             
         if device in self.shared_memory:
             with self.shared_locks[device]:
@@ -204,63 +655,224 @@ class GPUMemoryManager:
             GPU张量
         """
         if target_device is None:
-            target_device = self.devices[0]
+            target_device = self._default_device
             
         try:
-            # 使用pin_memory加速CPU到GPU传输
-            if isinstance(data, np.ndarray):
-                # 创建pinned memory
-                tensor_cpu = torch.from_numpy(data).pin_memory()
-                # 异步传输到GPU
-                tensor_gpu = tensor_cpu.to(target_device, non_blocking=True)
+            if (target_device in self.integrated_devices and isinstance(data, np.ndarray)
+                    and data.flags['C_CONTIGUOUS']):
+                # 集成GPU：直接映射numpy缓冲区，CPU和GPU看到同一块内存
+                return self._map_host_array(data, target_device)
+            elif isinstance(data, np.ndarray) and target_device.startswith('cuda'):
+                # 独立显卡：拷贝到复用的锁页暂存区，再在专用传输流上异步传输到GPU
+                staging, done = self._get_pinned_staging(data)
+                done.synchronize()  # 上一次从该暂存区发出的传输完成后才能覆盖
+                np.copyto(staging.numpy(), data, casting='no')
+                
+                stream = self._get_h2d_stream(target_device)
+                with torch.cuda.stream(stream):
+                    with self._use_pool(target_device):
+                        tensor_gpu = staging.to(target_device, non_blocking=True)
+                    done.record(stream)
+                
+                # 计算流在GPU上等待传输完成，不阻塞主机；张量会在计算流上使用
+                consumer = torch.cuda.current_stream(target_device)
+                consumer.wait_stream(stream)
+                tensor_gpu.record_stream(consumer)
                 return tensor_gpu
+            elif isinstance(data, np.ndarray):
+                return torch.from_numpy(data)
             else:
                 return torch.as_tensor(data, device=target_device)
                 
         except Exception as e:
-            print(f"[WARNING] 零拷贝传输失败: {e}")
+            _log_throttled(logging.WARNING, "零拷贝传输失败: %s", str(e))
             return torch.tensor(data, device=target_device)
             
+    def _map_host_array(self, data: np.ndarray, device: str) -> torch.Tensor:
+        """把numpy缓冲区注册为映射锁页内存并包装成GPU张量（仅集成GPU）"""
+        ptr = data.ctypes.data
+        cached = self._mapped_host.get(ptr)
+        if cached is not None and cached.nbytes >= data.nbytes:
+            self._mapped_host.move_to_end(ptr)
+        else:
+            cudart = torch.cuda.cudart()
+            if cached is not None:
+                cudart.cudaHostUnregister(ptr)
+                del self._mapped_host[ptr]
+            err = cudart.cudaHostRegister(ptr, data.nbytes, CUDA_HOST_REGISTER_MAPPED)
+            if int(err) != 0:
+                raise RuntimeError(f"cudaHostRegister失败: {err}")
+            self._mapped_host[ptr] = data
+            
+            if len(self._mapped_host) > MAPPED_HOST_CACHE_SIZE:
+                # GPU可能仍在读取被淘汰的缓冲区，注销前先同步
+                torch.cuda.synchronize(device)
+                old_ptr, _ = self._mapped_host.popitem(last=False)
+                cudart.cudaHostUnregister(old_ptr)
+        
+        # 统一寻址下映射内存的设备指针与主机指针相同
+        return torch.as_tensor(_CudaArrayView(ptr, data.shape, data.dtype), device=device)
+        
+    def push_frame(self, frame: np.ndarray, device: str = None) -> torch.Tensor:
+        """
+        通过环形缓冲区把截图帧上传到GPU（传输与推理重叠）
+        
+        返回的张量属于环形缓冲区，FRAME_RING_SIZE 帧之后会被覆盖；
+        当前流已在GPU上等待传输完成，可以直接使用
+        """
+        if device is None:
+            device = self._default_device
+        if not device.startswith('cuda'):
+            return torch.from_numpy(frame)
+        
+        key = (device, frame.shape, frame.dtype)
+        ring = self._frame_rings.get(key)
+        if ring is None:
+            with self._use_pool(device):
+                ring = self._frame_rings[key] = PinnedRing(frame.shape, frame.dtype, device,
+                                                           self._get_h2d_stream(device))
+        
+        tensor, event = ring.push(frame)
+        torch.cuda.current_stream(device).wait_event(event)
+        return tensor
+        
+    def capture_graph(self, fn, example_inputs: List[torch.Tensor], device: str = None,
+                      warmup_iters: int = GRAPH_WARMUP_ITERS):
+        """
+        把固定形状的 fn(*example_inputs) 捕获为CUDA Graph（如FP16 (1,3,320,320)/(1,3,640,640) 的前向）
+        
+        Returns:
+            replay(*inputs)：把输入拷入静态输入张量后重放图，返回静态输出（下次重放会被覆盖）
+        """
+        if device is None:
+            device = self._default_device
+        
+        static_inputs = [t.clone() for t in example_inputs]
+        
+        # 在侧流上预热
+        stream = torch.cuda.Stream(device=device)
+        stream.wait_stream(torch.cuda.current_stream(device))
+        with torch.cuda.stream(stream):
+            for _ in range(warmup_iters):
+                fn(*static_inputs)
+        torch.cuda.current_stream(device).wait_stream(stream)
+        
+        pool = self._graph_pools.get(device)
+        if pool is None:
+            pool = self._graph_pools[device] = torch.cuda.graph_pool_handle()
+        
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=pool):
+            static_output = fn(*static_inputs)
+        self._graphs.append(graph)
+        
+        def replay(*inputs):
+            for static_input, x in zip(static_inputs, inputs):
+                static_input.copy_(x, non_blocking=True)
+            graph.replay()
+            return static_output
+        
+        return replay
+        
+    def _get_pinned_staging(self, data: np.ndarray) -> Tuple[torch.Tensor, torch.cuda.Event]:
+        """获取当前线程与 data 形状/类型匹配的锁页暂存缓冲区，不存在时创建并按LRU淘汰"""
+        cache = getattr(self._staging_local, 'buffers', None)
+        if cache is None:
+            cache = self._staging_local.buffers = OrderedDict()
+        
+        key = (data.shape, data.dtype)
+        entry = cache.get(key)
+        if entry is not None:
+            cache.move_to_end(key)
+            return entry
+        
+        # 只有首次遇到该形状时才分配并锁页
+        staging = torch.from_numpy(np.empty(data.shape, dtype=data.dtype)).pin_memory()
+        entry = (staging, torch.cuda.Event())
+        cache[key] = entry
+        if len(cache) > PINNED_STAGING_CAPACITY:
+            cache.popitem(last=False)
+        return entry
+        
+    def _get_h2d_stream(self, device: str) -> torch.cuda.Stream:
+        """获取设备专用的主机到显存传输流"""
+        stream = self._h2d_streams.get(device)
+        if stream is None:
+            stream = self._h2d_streams[device] = torch.cuda.Stream(device=device)
+        return stream
+        
     def batch_allocate(self, sizes: List[Tuple], dtype=torch.float16, device: str = None) -> List[torch.Tensor]:
-        """批量分配张量（提高效率）"""
+        """
+        批量分配张量：一次分配总字节数，返回其中按 BATCH_ALIGN_BYTES 对齐的视图
+        
+        所有张量共享同一块显存，最后一个视图释放后整块一起释放，无需 deallocate_tensor
+        """
         if device is None:
-            device = self.devices[0]
+            device = self._default_device
+        if not sizes:
+            return []
             
-        tensors = []
+        itemsize = _dtype_bytes(dtype)
+        align = max(BATCH_ALIGN_BYTES // itemsize, 1)
+        offsets = []
+        total = 0
         for size in sizes:
-            tensor = self.allocate_tensor(size, dtype, device)
-            tensors.append(tensor)
-            
-        return tensors
+            offsets.append(total)
+            total += (math.prod(size) + align - 1) // align * align
+        
+        with self._use_pool(device):
+            try:
+                slab = torch.empty(total, dtype=dtype, device=device)
+            except torch.cuda.OutOfMemoryError:
+                self._emergency_cleanup(device)
+                slab = torch.empty(total, dtype=dtype, device=device)
+        self.stats['allocations'] += 1
+        
+        return [slab[offset:offset + math.prod(size)].view(size) for offset, size in zip(offsets, sizes)]
         
     def _emergency_cleanup(self, device: str):
         """紧急内存清理"""
-        print(f"[WARNING] {device} 内存不足，执行紧急清理...")
+        _log_throttled(logging.WARNING, "%s 内存不足，执行紧急清理", device)
         
         try:
             # 清理未使用的内存池
             if device in self.memory_pools:
                 with self.pool_locks[device]:
-                    unused_keys = [k for k, used in self.pool_usage[device].items() if not used]
-                    for key in unused_keys:
-                        if key in self.memory_pools[device]:
-                            del self.memory_pools[device][key]
-                            del self.pool_usage[device][key]
+                    self._release_free_buffers(device)
                             
-            # 强制GPU垃圾回收
-            if device != 'cpu':
-                torch.cuda.empty_cache()
+            # 记录私有内存池的段状态，便于排查碎片
+            pool = self._pools.get(device)
+            if pool is not None and logger.isEnabledFor(logging.INFO):
+                segments = pool.snapshot()
+                reserved = sum(seg['total_size'] for seg in segments)
+                active = sum(seg['allocated_size'] for seg in segments)
+                _log_throttled(logging.INFO, "%s 内存池: %d个段, 保留%.1fMB, 使用中%.1fMB",
+                               device, len(segments), reserved / 1024**2, active / 1024**2)
                 
-            # 系统垃圾回收
+            # 先同步回收循环引用：仍持有CUDA张量的垃圾释放后，这些块才能回到缓存分配器供重试使用
             gc.collect()
             
-            print(f"[INFO] {device} 紧急清理完成")
+            # 只有空闲的保留显存仍然很多时才清空缓存分配器
+            if device != 'cpu':
+                self._trim_cached_memory(device)
+            
+            _log_throttled(logging.INFO, "%s 紧急清理完成", device)
             
         except Exception as e:
-            print(f"[ERROR] 紧急清理失败: {e}")
+            _log_throttled(logging.ERROR, "紧急清理失败: %s", str(e))
+            
+    def _trim_cached_memory(self, device: str):
+        """缓存分配器中空闲的保留显存超过阈值时才调用 empty_cache，避免无谓的设备同步"""
+        cached_free = torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+        if cached_free > EMPTY_CACHE_THRESHOLD_BYTES:
+            torch.cuda.empty_cache()
             
     def get_memory_usage(self) -> Dict[str, Dict]:
-        """获取内存使用情况"""
+        """获取内存使用情况（结果缓存 MEMORY_USAGE_TTL 秒）"""
+        now = time.monotonic()
+        if now - self._usage_cache[0] < MEMORY_USAGE_TTL:
+            return self._usage_cache[1]
+        
         usage = {}
         
         for device in self.devices:
@@ -278,17 +890,21 @@ class GPUMemoryManager:
                     device_id = int(device.split(':')[1])
                     allocated = torch.cuda.memory_allocated(device_id) / 1024**3
                     reserved = torch.cuda.memory_reserved(device_id) / 1024**3
-                    total = torch.cuda.get_device_properties(device_id).total_memory / 1024**3
+                    # 一次驱动调用同时得到设备空闲/总显存
+                    free, total = torch.cuda.mem_get_info(device_id)
+                    total /= 1024**3
                     
                     usage[device] = {
                         'allocated_gb': allocated,
                         'reserved_gb': reserved,
+                        'free_gb': free / 1024**3,
                         'total_gb': total,
                         'percent': (allocated / total) * 100
                     }
                 except:
                     usage[device] = {'error': 'Unable to get GPU memory info'}
                     
+        self._usage_cache = (now, usage)
         return usage
         
     def get_pool_statistics(self) -> Dict:
@@ -300,8 +916,8 @@ class GPUMemoryManager:
         used_buffers = 0
         
         for device in self.memory_pools:
-            device_total = len(self.memory_pools[device])
-            device_used = sum(1 for used in self.pool_usage[device].values() if used)
+            device_used = len(self.pool_usage[device])
+            device_total = device_used + sum(len(free_list) for free_list in self.memory_pools[device].values())
             
             total_buffers += device_total
             used_buffers += device_used
@@ -321,28 +937,37 @@ class GPUMemoryManager:
         # 内存节省
         stats['memory_saved_mb'] = stats['memory_saved_bytes'] / 1024**2
         
+        # slab碎片情况：最大连续空闲块
+        stats['slab_largest_free_mb'] = {
+            device: {name: slab.largest_free_block() / 1024**2 for name, slab in slabs.items()}
+            for device, slabs in self.slabs.items()
+        }
+        
         return stats
         
     def optimize_memory_layout(self):
         """优化内存布局"""
-        print("[INFO] 🔧 开始内存布局优化...")
+        logger.info("开始内存布局优化")
         
         for device in self.devices:
             if device == 'cpu':
                 continue
                 
             try:
+                # 重新整理内存池：空闲块归还slab并合并
+                self._reorganize_memory_pool(device)
+                
+                # 按实际分配画像重建预分配集合
+                self._prefetch_profiled_buffers(device)
+                
                 # 清理碎片化内存
                 if device.startswith('cuda'):
-                    torch.cuda.empty_cache()
-                    
-                # 重新整理内存池
-                self._reorganize_memory_pool(device)
+                    self._trim_cached_memory(device)
                 
             except Exception as e:
-                print(f"[WARNING] {device} 内存优化失败: {e}")
+                logger.warning("%s 内存优化失败: %s", device, e)
                 
-        print("[INFO] ✅ 内存布局优化完成")
+        logger.info("内存布局优化完成")
         
     def _reorganize_memory_pool(self, device: str):
         """重新整理内存池"""
@@ -350,12 +975,9 @@ class GPUMemoryManager:
             return
             
         with self.pool_locks[device]:
-            # 释放未使用的缓冲区
-            unused_keys = [k for k, used in self.pool_usage[device].items() if not used]
-            for key in unused_keys[:len(unused_keys)//2]:  # 只释放一半，保留一些缓存
-                if key in self.memory_pools[device]:
-                    del self.memory_pools[device][key]
-                    del self.pool_usage[device][key]
+            # 释放未使用的缓冲区：每个分桶只释放一半，保留一些缓存；
+            # 归还到slab的块会与相邻空闲块合并，恢复成可供大请求使用的连续空间
+            self._release_free_buffers(device, keep_ratio=0.5)
                     
     def cleanup(self):
         """清理所有GPU资源"""
@@ -367,11 +989,26 @@ class GPUMemoryManager:
                 with self.pool_locks[device]:
                     self.memory_pools[device].clear()
                     self.pool_usage[device].clear()
+            self.slabs.clear()
+            self._frame_rings.clear()
+            self._graphs.clear()
+            self._graph_pools.clear()
+            
+            # 注销映射的主机内存
+            if self._mapped_host:
+                torch.cuda.synchronize()
+                cudart = torch.cuda.cudart()
+                for ptr in self._mapped_host:
+                    cudart.cudaHostUnregister(ptr)
+                self._mapped_host.clear()
+            self._pools.clear()
                     
             # 清理共享内存
             for device in self.shared_memory:
                 with self.shared_locks[device]:
                     self.shared_memory[device].clear()
+            self._shared_arena.clear()
+            self._shared_offset.clear()
                     
             # 清理GPU缓存
             for device in self.devices:
@@ -389,20 +1026,25 @@ class GPUMemoryManager:
 
 # 全局内存管理器实例
 _memory_manager = None
+_memory_manager_lock = threading.Lock()
 
 def get_gpu_memory_manager(device_ids: List[int] = [0], pool_size_gb: float = 4.0) -> GPUMemoryManager:
     """获取GPU内存管理器单例"""
     global _memory_manager
+    # 双重检查：多个线程同时首次获取时只创建一个管理器，避免重复预分配
     if _memory_manager is None:
-        _memory_manager = GPUMemoryManager(device_ids, pool_size_gb)
+        with _memory_manager_lock:
+            if _memory_manager is None:
+                _memory_manager = GPUMemoryManager(device_ids, pool_size_gb)
     return _memory_manager
 
 def cleanup_gpu_memory_manager():
     """清理GPU内存管理器"""
     global _memory_manager
-    if _memory_manager is not None:
-        _memory_manager.cleanup()
-        _memory_manager = None
+    with _memory_manager_lock:
+        if _memory_manager is not None:
+            _memory_manager.cleanup()
+            _memory_manager = None
 
 if __name__ == "__main__":
     # 测试GPU内存管理器
@@ -8,8 +8,23 @@ GPU内存最大化配置器
 import json
 import os
 import torch
-import GPUtil
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+
+from unified_memory_config import ALLOCATOR_CONF
+
+# 直接调用NVML C接口查询显存（GPUtil每次都要启动nvidia-smi子进程）
+try:
+    import pynvml
+    PYNVML_AVAILABLE = True
+except ImportError:
+    PYNVML_AVAILABLE = False
+
+# NVML不可用时的最后回退
+try:
+    import GPUtil
+    GPUTIL_AVAILABLE = True
+except ImportError:
+    GPUTIL_AVAILABLE = False
 
 class GPUMemoryMaximizer:
     """GPU内存最大化配置器"""
@@ -31,12 +46,12 @@ class GPUMemoryMaximizer:
         if torch.cuda.is_available():
             try:
                 # 获取GPU信息
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu = gpus[0]  # 主GPU
-                    analysis['total_vram_gb'] = gpu.memoryTotal / 1024  # MB转GB
-                    analysis['current_usage_gb'] = gpu.memoryUsed / 1024
-                    analysis['available_vram_gb'] = (gpu.memoryTotal - gpu.memoryUsed) / 1024
+                memory = self._query_vram_gb()
+                if memory:
+                    total_gb, used_gb = memory  # 主GPU
+                    analysis['total_vram_gb'] = total_gb
+                    analysis['current_usage_gb'] = used_gb
+                    analysis['available_vram_gb'] = total_gb - used_gb
                     
                     # 计算推荐的统一内存大小
                     total_vram = analysis['total_vram_gb']
@@ -58,6 +73,29 @@ class GPUMemoryMaximizer:
         
         return analysis
     
+    def _query_vram_gb(self) -> Optional[Tuple[float, float]]:
+        """查询主GPU的 (总显存, 已用显存)，单位GB：NVML → torch.cuda.mem_get_info → GPUtil"""
+        if PYNVML_AVAILABLE:
+            try:
+                pynvml.nvmlInit()
+                handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+                mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                return mem.total / 1024**3, mem.used / 1024**3
+            except Exception as e:
+                print(f"[WARNING] NVML查询失败: {e}")
+        
+        try:
+            free, total = torch.cuda.mem_get_info(0)
+            return total / 1024**3, (total - free) / 1024**3
+        except Exception as e:
+            print(f"[WARNING] torch显存查询失败: {e}")
+        
+        if GPUTIL_AVAILABLE:
+            gpus = GPUtil.getGPUs()
+            if gpus:
+                return gpus[0].memoryTotal / 1024, gpus[0].memoryUsed / 1024  # MB转GB
+        return None
+    
     def calculate_optimal_gpu_config(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
         """计算最优GPU配置"""
         config = {
@@ -68,7 +106,8 @@ class GPUMemoryMaximizer:
             "performance_monitoring": True,
             "memory_pool_preallocation": True,
             "zero_copy_optimization": True,
-            "debug_unified_memory": False
+            "debug_unified_memory": False,
+            "allocator_conf": ALLOCATOR_CONF
         }
         
         # 根据显存容量设置统一内存大小
@@ -151,7 +190,10 @@ class GPUMemoryMaximizer:
                 with open(self.config_file, "r", encoding="utf-8") as f:
                     current_config = json.load(f)
             
-            # 更新统一内存配置
+            # 更新统一内存配置（保留用户手动设置的进程显存上限 memory_limit_gb）
+            previous = current_config.get("unified_memory")
+            if isinstance(previous, dict) and "memory_limit_gb" in previous:
+                optimal_config = dict(optimal_config, memory_limit_gb=previous["memory_limit_gb"])
             current_config["unified_memory"] = optimal_config
             
             # 保存配置
@@ -187,6 +229,7 @@ class GPUMemoryMaximizer:
         print(f"  • 内存池: {config.get('gpu_memory_pool_size_mb', 0)}MB")
         print(f"  • GPU缓存: {config.get('gpu_cache_size_mb', 0)}MB")
         print(f"  • 优化级别: {config.get('memory_optimization_level', 'N/A')}")
+        print(f"  • 分配器配置: {config.get('allocator_conf', 'N/A')}")
         
         # 启用的优化功能
         print(f"\n🔧 启用的优化功能:")
@@ -253,6 +296,7 @@ class GPUMemoryMaximizer:
         
         # 计算最优配置
         print("\n[STEP 2] ⚙️ 计算最优GPU内存配置...")
+        # allocator_conf 随配置保存，由主程序启动时在初始化CUDA之前设置（unified_memory_config）
         optimal_config = self.calculate_optimal_gpu_config(analysis)
         
         # 更新配置
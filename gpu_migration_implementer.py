@@ -13,116 +13,753 @@
 
 import os
 import re
+import ast
+import mmap
+import hashlib
 import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Tuple
 
+# 注入到迁移后文件中的传输辅助函数：
+# 上传复用按形状缓存的锁页缓冲区（避免可分页内存的同步H2D拷贝），上传/回传分别在独立的流上异步进行
+PINNED_UPLOAD_HELPER = '''
+# GPU迁移：按 (shape, dtype) 缓存的锁页上传缓冲区，以及上传/回传专用流（首次使用时创建）
+_PIN_BUFS = {}
+_TRANSFER_STREAMS = {}
+
+def _transfer_stream(name):
+    stream = _TRANSFER_STREAMS.get(name)
+    if stream is None:
+        stream = _TRANSFER_STREAMS[name] = torch.cuda.Stream()
+    return stream
+
+def _to_cuda_pinned(arr):
+    """经复用的锁页缓冲区，在上传流上把numpy数组异步传到GPU；已是张量（上一步迁移的GPU结果）时原样返回"""
+    if isinstance(arr, torch.Tensor):
+        return arr
+    key = (arr.shape, arr.dtype)
+    entry = _PIN_BUFS.get(key)
+    if entry is None:
+        entry = _PIN_BUFS[key] = (torch.from_numpy(np.empty(arr.shape, dtype=arr.dtype)).pin_memory(),
+                                  torch.cuda.Event())
+    buf, done = entry
+    done.synchronize()  # 上一次从该缓冲区发出的传输完成后才能覆盖
+    buf.copy_(torch.from_numpy(arr))
+    
+    h2d = _transfer_stream('h2d')
+    with torch.cuda.stream(h2d):
+        tensor = buf.to('cuda', non_blocking=True)
+        done.record(h2d)
+    # 计算流在GPU上等待上传完成，不阻塞主机
+    consumer = torch.cuda.current_stream()
+    consumer.wait_stream(h2d)
+    tensor.record_stream(consumer)
+    return tensor
+
+def _to_host(tensor):
+    """在回传流上把GPU结果异步拷到锁页内存，返回numpy数组"""
+    d2h = _transfer_stream('d2h')
+    d2h.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(d2h):
+        out = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+        out.copy_(tensor, non_blocking=True)
+        tensor.record_stream(d2h)
+    d2h.synchronize()
+    return out.numpy()
+'''
+
+# 注入到迁移后文件中的流水线回传函数（依赖 PINNED_UPLOAD_HELPER 中的回传流）：
+# 循环内每次只发起异步D2H，返回上一次迭代的结果，帧循环中不再每帧同步等待GPU
+PIPELINED_D2H_HELPER = '''
+# GPU迁移：每个调用点一对锁页输出缓冲区及其完成事件，交替使用（N-1流水线）
+_PIPELINED_OUT = {}
+
+def _to_host_pipelined(site, tensor):
+    """在回传流上异步拷出本次结果，返回该调用点上一次的结果；首次调用时等待本次结果"""
+    state = _PIPELINED_OUT.get(site)
+    if state is None:
+        state = _PIPELINED_OUT[site] = {'bufs': [None, None], 'events': [torch.cuda.Event(), torch.cuda.Event()],
+                                        'cur': 0, 'primed': False}
+    cur = state['cur']
+    buf = state['bufs'][cur]
+    if buf is None or buf.shape != tensor.shape or buf.dtype != tensor.dtype:
+        buf = state['bufs'][cur] = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+    
+    d2h = _transfer_stream('d2h')
+    d2h.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(d2h):
+        buf.copy_(tensor, non_blocking=True)
+        tensor.record_stream(d2h)
+        state['events'][cur].record(d2h)
+    
+    state['cur'] = 1 - cur
+    ready = cur if not state['primed'] else 1 - cur
+    state['primed'] = True
+    # 上一次的拷贝已经过一整个迭代，通常早已完成，这里几乎不会等待
+    state['events'][ready].synchronize()
+    # 缓冲区下下次会被覆盖，返回副本
+    return state['bufs'][ready].numpy().copy()
+'''
+
+# 注入到迁移后文件中的零缓冲区函数：常量形状的缓冲区首次使用时才在GPU上分配，
+# 导入迁移后的模块不会初始化CUDA（此时分配器配置和显存上限可能尚未设置）
+ZERO_BUFFER_HELPER = '''
+# GPU迁移：按形状缓存的零缓冲区（首次使用时分配），使用处原地 zero_()
+_ZERO_BUFS = {}
+
+def _zbuf(shape):
+    key = tuple(shape) if isinstance(shape, list) else shape
+    buf = _ZERO_BUFS.get(key)
+    if buf is None:
+        buf = _ZERO_BUFS[key] = torch.zeros(key, dtype=torch.float32, device='cuda')
+    return buf.zero_()
+'''
+
+# 注入到迁移后文件中的数组转换函数：运行时按元素数选择路径
+GPU_ARRAY_HELPER = '''
+# GPU迁移：元素数达到阈值才经GPU转换，PCIe传输和内核启动开销在此以下无法摊销
+_GPU_ARRAY_MIN_SIZE = 4096
+
+def _gpu_array(data):
+    if isinstance(data, torch.Tensor):
+        # 上一步迁移留在GPU上的结果：np.array 的语义是拷贝为numpy数组
+        return data.cpu().numpy()
+    if not isinstance(data, np.ndarray) or data.size < _GPU_ARRAY_MIN_SIZE:
+        # PIL/mss 截图等对象的 size 是 (宽, 高) 元组，交给 np.array 按原语义转换
+        return np.array(data)
+    return torch.tensor(data, device='cuda').cpu().numpy()
+'''
+
+# 注入到迁移后文件中的缩放函数：导入时编译一次，避免每次调用逐个分派 permute/cast/interpolate 等算子
+GPU_RESIZE_HELPER = '''
+# GPU迁移：TorchScript编译的缩放流水线（HWC输入，尺寸参数与cv2.resize相同为 宽, 高；与cv2.resize一样保持输入数据类型）
+@torch.jit.script
+def _gpu_resize(img: torch.Tensor, w: int, h: int) -> torch.Tensor:
+    out = torch.nn.functional.interpolate(img.permute(2, 0, 1).unsqueeze(0).float(), size=[h, w],
+                                          mode='bilinear', align_corners=False)
+    return out.squeeze(0).permute(1, 2, 0).to(img.dtype)
+'''
+
+def _is_module_call(node, module: str, attr: str) -> bool:
+    """node 是否为 module.attr(...) 调用"""
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr == attr and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == module)
+
+def _is_np_float32(node) -> bool:
+    """node 是否为 np.float32"""
+    return (isinstance(node, ast.Attribute) and node.attr == 'float32'
+            and isinstance(node.value, ast.Name) and node.value.id == 'np')
+
+def _astype_float32_receiver(node):
+    """node 为 X.astype(np.float32) 时返回 X，否则返回None"""
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'astype'
+            and len(node.args) == 1 and not node.keywords and _is_np_float32(node.args[0])):
+        return node.func.value
+    return None
+
+def _normalized_receiver(node):
+    """node 为 X.astype(np.float32) / 255.0 时返回 X，否则返回None"""
+    if (isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div)
+            and isinstance(node.right, ast.Constant) and node.right.value == 255.0):
+        return _astype_float32_receiver(node.left)
+    return None
+
+def _resize_args(node):
+    """node 为 cv2.resize(img, size) 时返回 (img, size)，否则返回None"""
+    if _is_module_call(node, 'cv2', 'resize') and len(node.args) == 2 and not node.keywords:
+        return node.args[0], node.args[1]
+    return None
+
+def _match_resize_then_normalize(node):
+    """cv2.resize(img, size).astype(np.float32) / 255.0"""
+    receiver = _normalized_receiver(node)
+    return _resize_args(receiver) if receiver is not None else None
+
+def _match_normalize_then_resize(node):
+    """cv2.resize(img.astype(np.float32) / 255.0, size)"""
+    args = _resize_args(node)
+    if args is None:
+        return None
+    receiver = _normalized_receiver(args[0])
+    return (receiver, args[1]) if receiver is not None else None
+
+def _match_image_normalize(node):
+    """img.astype(np.float32) / 255.0"""
+    receiver = _normalized_receiver(node)
+    return (receiver,) if receiver is not None else None
+
+def _match_numpy_zeros(node):
+    """np.zeros(shape, dtype=np.float32)"""
+    if (_is_module_call(node, 'np', 'zeros') and len(node.args) == 1 and len(node.keywords) == 1
+            and node.keywords[0].arg == 'dtype' and _is_np_float32(node.keywords[0].value)):
+        return (node.args[0],)
+    return None
+
+def _match_numpy_array(node):
+    """np.array(data)，元素少于 MIN_LITERAL_ELEMENTS 的列表/元组字面量不迁移"""
+    if _is_module_call(node, 'np', 'array') and len(node.args) == 1 and not node.keywords:
+        data = node.args[0]
+        if isinstance(data, (ast.List, ast.Tuple)):
+            elements = sum(1 for child in ast.walk(data) if not isinstance(child, (ast.List, ast.Tuple)))
+            if elements < MIN_LITERAL_ELEMENTS:
+                return None
+        return (data,)
+    return None
+
+# 小字面量在CPU上构建只需一次列表遍历，经GPU要多出显存分配、H2D、内核启动和D2H，远比原代码慢
+MIN_LITERAL_ELEMENTS = 256
+
+# 归一化迁移以uint8上传（数据量为float32的1/4），只对确定来自这些uint8图像源的变量实施
+UINT8_SOURCE_CALLS = frozenset({'imread', 'grab', 'screen_grab', 'get_latest_frame'})
+# 向上查找变量最近一次赋值的行数范围
+DTYPE_LOOKBACK_LINES = 40
+
+def _is_uint8_expr(node) -> bool:
+    """表达式是否确定产生uint8数组：调用了已知的uint8图像源，或显式指定了 np.uint8"""
+    for child in ast.walk(node):
+        if isinstance(child, ast.Attribute) and child.attr == 'uint8':
+            return True
+        if isinstance(child, ast.Constant) and child.value == 'uint8':
+            return True
+        if isinstance(child, ast.Call):
+            func = child.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+            if name in UINT8_SOURCE_CALLS:
+                return True
+    return False
+
+# 进入这些节点即进入新的作用域，外层循环的外提位置对其内部不再有效
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+
+def _loop_stored_names(loop) -> set:
+    """循环每次迭代都可能重新绑定的变量名（循环变量以及循环体内的赋值）"""
+    parts = [loop.target] + loop.body if isinstance(loop, (ast.For, ast.AsyncFor)) else [loop.test] + loop.body
+    return {node.id for part in parts for node in ast.walk(part)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+
+def _is_loop_invariant(groups, stored_names: set) -> bool:
+    """
+    参数节点是否与循环迭代无关：不引用循环内绑定的变量，且不含调用（调用结果可能每次不同）、
+    属性或下标访问（self.shape = ... 或方法调用都可能在循环内修改对象状态）
+    """
+    for group in groups:
+        for node in ast.walk(group):
+            if isinstance(node, (ast.Call, ast.Attribute, ast.Subscript)):
+                return False
+            if isinstance(node, ast.Name) and node.id in stored_names:
+                return False
+    return True
+
+def _is_literal(node) -> bool:
+    """节点是否为常量字面量（如固定形状元组）"""
+    try:
+        ast.literal_eval(node)
+        return True
+    except (ValueError, SyntaxError, TypeError):
+        return False
+
+def _host_result(node):
+    """node 为 _to_host(E) 或 E.cpu().numpy() 时返回 E（GPU张量回传主机），否则返回None"""
+    if not isinstance(node, ast.Call) or node.keywords:
+        return None
+    if isinstance(node.func, ast.Name) and node.func.id == '_to_host' and len(node.args) == 1:
+        return node.args[0]
+    if (not node.args and isinstance(node.func, ast.Attribute) and node.func.attr == 'numpy'
+            and isinstance(node.func.value, ast.Call) and not node.func.value.args
+            and not node.func.value.keywords and isinstance(node.func.value.func, ast.Attribute)
+            and node.func.value.func.attr == 'cpu'):
+        return node.func.value.func.value
+    return None
+
+def _uses_shared_buffer(node) -> bool:
+    """表达式是否引用迁移生成的共享零缓冲区（_zbuf(...) / 外提的 _zbuf_*）"""
+    return any(isinstance(child, ast.Name) and (child.id == '_zbuf' or child.id.startswith('_zbuf_'))
+               for child in ast.walk(node))
+
+def _is_gpu_expr(node) -> bool:
+    """
+    表达式是否产生GPU张量：根为 _to_cuda_pinned / _gpu_resize / interpolate / torch.zeros(device='cuda')，
+    其后只接张量方法调用或下标（中途经过 .cpu()/.numpy() 则已回到主机）
+    """
+    while True:
+        if isinstance(node, ast.Subscript):
+            node = node.value
+            continue
+        if not isinstance(node, ast.Call):
+            return False
+        func = node.func
+        if isinstance(func, ast.Name):
+            return func.id in ('_to_cuda_pinned', '_gpu_resize')
+        if not isinstance(func, ast.Attribute) or func.attr in ('cpu', 'numpy', 'tolist', 'item'):
+            return False
+        if func.attr == 'interpolate':
+            return True
+        if func.attr == 'zeros' and isinstance(func.value, ast.Name) and func.value.id == 'torch':
+            return any(keyword.arg == 'device' and isinstance(keyword.value, ast.Constant)
+                       and str(keyword.value.value).startswith('cuda') for keyword in node.keywords)
+        node = func.value
+
+def _upload_arg(node):
+    """node 为 _to_cuda_pinned(X) 时返回 X，否则返回None"""
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == '_to_cuda_pinned'
+            and len(node.args) == 1 and not node.keywords):
+        return node.args[0]
+    return None
+
+def _round_trip_edits(tree, span, source) -> List[List[Tuple[int, int, str]]]:
+    """
+    找出迁移后代码中 GPU→主机→GPU 的往返，每处往返对应一组需同时应用的编辑：
+    1. _to_cuda_pinned(_to_host(E)) 直接折叠为 E
+    2. V = _to_host(E) 且 V 在作用域内只被一个后续的 _to_cuda_pinned(V) 使用时，V 保持张量形式
+    3. V 在作用域内只被赋值一次且值本身就是GPU张量（如 keep_on_gpu 的归一化结果）时，_to_cuda_pinned(V) 改为 V
+    E 引用共享零缓冲区时不处理：必须经 _to_host 拷贝，否则结果与缓冲区共用存储
+    """
+    edits = []
+    for node in ast.walk(tree):
+        inner = _upload_arg(node)
+        if inner is not None and _host_result(inner) is not None and not _uses_shared_buffer(inner):
+            start, end = span(node)
+            edits.append([(start, end, f"({source(_host_result(inner))})")])
+    
+    scopes = [tree] + [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    for scope in scopes:
+        # 统计包含嵌套函数在内的全部引用（嵌套作用域的同名变量只会让判断更保守）
+        names = {}
+        for node in ast.walk(scope):
+            if isinstance(node, ast.Name):
+                names.setdefault(node.id, []).append(node)
+        uploads = {}
+        for node in ast.walk(scope):
+            arg = _upload_arg(node)
+            if isinstance(arg, ast.Name):
+                uploads[id(arg)] = node
+        
+        # 只看本作用域直接包含的赋值语句
+        gpu_names = set()
+        stack = list(ast.iter_child_nodes(scope))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, _SCOPE_NODES):
+                continue
+            stack.extend(ast.iter_child_nodes(node))
+            if not (isinstance(node, ast.Assign) and len(node.targets) == 1
+                    and isinstance(node.targets[0], ast.Name)):
+                continue
+            if _is_gpu_expr(node.value):
+                gpu_names.add(node.targets[0].id)
+                continue
+            value = _host_result(node.value)
+            # 共享零缓冲区必须经 _to_host 拷贝，否则变量会与缓冲区共用存储
+            if value is None or _uses_shared_buffer(value):
+                continue
+            refs = names[node.targets[0].id]
+            loads = [ref for ref in refs if isinstance(ref.ctx, ast.Load)]
+            if len(refs) != 2 or len(loads) != 1 or id(loads[0]) not in uploads:
+                continue
+            use = uploads[id(loads[0])]
+            if span(use)[0] < span(node)[1]:
+                continue
+            edits.append([span(node.value) + (source(value),), span(use) + (loads[0].id,)])
+        
+        for name in gpu_names:
+            refs = names[name]
+            if sum(1 for ref in refs if not isinstance(ref.ctx, ast.Load)) != 1:
+                continue
+            for ref in refs:
+                if id(ref) in uploads:
+                    edits.append([span(uploads[id(ref)]) + (name,)])
+    return edits
+
+def _collapse_round_trips(content: str) -> Tuple[str, int]:
+    """消除迁移代码之间不必要的PCIe往返，返回 (新源码, 消除的往返数)"""
+    collapsed = 0
+    while True:
+        try:
+            tree = ast.parse(content)
+        except SyntaxError:
+            return content, collapsed
+        data = content.encode('utf-8')
+        line_starts = [0]
+        for line in data.splitlines(keepends=True):
+            line_starts.append(line_starts[-1] + len(line))
+        
+        def span(node) -> Tuple[int, int]:
+            return (line_starts[node.lineno - 1] + node.col_offset,
+                    line_starts[node.end_lineno - 1] + node.end_col_offset)
+        
+        def source(node) -> str:
+            start, end = span(node)
+            return data[start:end].decode('utf-8')
+        
+        # 相互嵌套的往返每轮只处理不重叠的部分，重新解析后继续，直到没有可消除的往返
+        applied = []
+        for group in _round_trip_edits(tree, span, source):
+            if all(end <= start_ or start >= end_ for start, end, _ in group for start_, end_, _ in applied):
+                applied.extend(group)
+                collapsed += 1
+        if not applied:
+            return content, collapsed
+        for start, end, code in sorted(applied, reverse=True):
+            data = data[:start] + code.encode('utf-8') + data[end:]
+        content = data.decode('utf-8')
+
+class _SourceMatch:
+    """AST匹配结果，提供与 re.Match 相同的 group() 接口（分组为对应节点的源码）"""
+    
+    def __init__(self, source: str, groups: List[str], hoist: Tuple[int, str] = None, in_loop: bool = False):
+        self._groups = [source] + groups
+        # 循环不变时为 (最外层循环所在行的起始字节偏移, 该行缩进)，可在此处外提分配
+        self.hoist = hoist
+        self.in_loop = in_loop
+        
+    def group(self, index: int = 0) -> str:
+        return self._groups[index]
+
 class GPUMigrationImplementer:
     """GPU迁移实施器"""
     
-    def __init__(self):
+    def __init__(self, keep_on_gpu: bool = False, pipeline_loop_d2h: bool = False, target_dtype: str = None):
+        """
+        Args:
+            keep_on_gpu: 生成的归一化代码直接返回GPU张量（下游是torch模型时），不再拷回numpy
+            pipeline_loop_d2h: 循环内的迁移改为双缓冲异步回传，每次迭代得到上一次迭代的结果（延迟一帧），
+                               换取不再每帧同步等待GPU；启用后随迭代变化的循环内迁移也会实施
+            target_dtype: keep_on_gpu 时归一化张量的浮点类型（'float16'/'bfloat16'/'float32'），
+                          None 时按文件自动检测：文件中有 .half() 调用或fp16 ONNX模型时用float16；
+                          回传主机的numpy结果始终保持原代码的float32
+        """
+        self.keep_on_gpu = keep_on_gpu
+        self.pipeline_loop_d2h = pipeline_loop_d2h
+        self.target_dtype = target_dtype
+        # 当前文件实际使用的浮点类型，每个文件处理前确定
+        self._file_dtype = target_dtype or 'float32'
         self.migration_count = 0
         self.files_modified = []
-        self.performance_gains = []
+        # 加速比 → 应用该加速比的迁移数，用于按迁移数加权的平均加速比
+        self.performance_gains = Counter()
+        # 当前文件中 形状源码 → 预分配零缓冲区变量名，每个文件处理前清空
+        # 当前文件中需要外提到循环之前的分配：{(插入偏移, 变量名): 声明行}
+        self._hoisted_allocs = {}
+        # 当前文件中流水线回传调用点的数量，用作各调用点的编号
+        self._pipeline_sites = 0
         
         # 高效迁移模式（基于测试结果）
+        # 按字典顺序匹配：同一个节点先尝试融合模式；匹配成功的节点不再深入其子节点
         self.efficient_migrations = {
+            'resize_then_normalize': {
+                'matcher': _match_resize_then_normalize,
+                'replacement': self.generate_gpu_resize_normalize_code,
+                'speedup': 5.3,
+                'priority': 'critical',
+                'requires_uint8': True
+            },
+            'normalize_then_resize': {
+                'matcher': _match_normalize_then_resize,
+                'replacement': self.generate_gpu_resize_normalize_code,
+                'speedup': 5.3,
+                'priority': 'critical',
+                'requires_uint8': True
+            },
             'cv2_resize': {
-                'pattern': r'cv2\.resize\s*\(\s*([^,]+),\s*\(([^)]+)\)\s*\)',
+                'matcher': _resize_args,
                 'replacement': self.generate_gpu_resize_code,
                 'speedup': 1.43,
                 'priority': 'high'
             },
             'image_normalize': {
-                'pattern': r'(\w+)\.astype\s*\(\s*np\.float32\s*\)\s*/\s*255\.0',
+                'matcher': _match_image_normalize,
                 'replacement': self.generate_gpu_normalize_code,
                 'speedup': 6.79,
-                'priority': 'critical'
+                'priority': 'critical',
+                'requires_uint8': True
             },
             'numpy_zeros': {
-                'pattern': r'np\.zeros\s*\(\s*([^)]+)\s*,\s*dtype\s*=\s*np\.float32\s*\)',
+                'matcher': _match_numpy_zeros,
                 'replacement': self.generate_gpu_zeros_code,
                 'speedup': 1.50,
-                'priority': 'medium'
+                'priority': 'medium',
+                # 非常量形状在循环内只有外提到循环前分配才有收益
+                'needs_hoist_in_loop': True
             },
             'numpy_array_conversion': {
-                'pattern': r'np\.array\s*\(\s*([^)]+)\s*\)',
+                'matcher': _match_numpy_array,
                 'replacement': self.generate_gpu_tensor_code,
                 'speedup': 1.20,
                 'priority': 'medium'
             }
         }
         
+        # 预筛选：覆盖所有匹配器需要的调用名，直接在字节上匹配，
+        # 一处都没有的文件无需解码和解析AST
+        self.migration_prefilter = re.compile(rb"cv2\.resize|\.astype|np\.zeros|np\.array")
+        
+        # 写回文件时用到的导入定位正则，只编译一次
+        self.any_import_pattern = re.compile(r'(import\s+\w+.*?\n)')
+        self.numpy_import_pattern = re.compile(r'(import\s+numpy\s+as\s+np.*?\n)')
+        self.torch_import_pattern = re.compile(
+            r'^(import[ \t]+torch[ \t]*\n(?:import[ \t]+torch\.nn\.functional[ \t]+as[ \t]+F[ \t]*\n)?)',
+            re.MULTILINE
+        )
+        # 半精度模型的迹象：.half() 调用，或文件名中带 fp16/half 的ONNX模型
+        self.half_model_pattern = re.compile(r"\.half\(\)|['\"][^'\"\n]*(?:fp16|half)[^'\"\n]*\.onnx['\"]", re.IGNORECASE)
+        
         print("[INFO] 🎯 GPU迁移实施器初始化完成")
     
+    def _host_code(self, gpu_code: str, match) -> str:
+        """把GPU结果回传为numpy的代码；启用流水线时循环内改用双缓冲异步回传"""
+        if self.pipeline_loop_d2h and getattr(match, 'in_loop', False):
+            site = self._pipeline_sites
+            self._pipeline_sites += 1
+            return f"_to_host_pipelined({site}, {gpu_code})"
+        return f"_to_host({gpu_code})"
+    
     def generate_gpu_resize_code(self, match) -> str:
         """生成GPU图像缩放代码"""
         image_var = match.group(1).strip()
         size_params = match.group(2).strip()
         
-        return f"""torch.nn.functional.interpolate(
-    torch.from_numpy({image_var}).permute(2, 0, 1).float().unsqueeze(0).to('cuda'),
-    size=({size_params}), mode='bilinear', align_corners=False
-).squeeze(0).permute(1, 2, 0).cpu().numpy().astype(np.uint8)"""
+        # _gpu_resize 在导入时编译一次：HWC上的 permute 只是视图（channels_last布局，无拷贝），
+        # 在GPU上转回输入的数据类型再回传（uint8图像回传数据量为float32的1/4）
+        return self._host_code(f"_gpu_resize(_to_cuda_pinned({image_var}), *({size_params}))", match)
+    
+    def _float_cast(self) -> str:
+        """
+        GPU上uint8转浮点的代码；结果留在GPU交给半精度模型时直接转为半精度，避免先转float32再被模型降精度。
+        回传主机时保持原代码 astype(np.float32) 的结果类型，下游的ORT会话或numpy运算仍拿到float32
+        """
+        if not self.keep_on_gpu or self._file_dtype == 'float32':
+            return ".float()"
+        return f".to(torch.{self._file_dtype})"
     
     def generate_gpu_normalize_code(self, match) -> str:
         """生成GPU图像归一化代码"""
         image_var = match.group(1).strip()
         
-        return f"""(torch.from_numpy({image_var}).float().to('cuda') / 255.0).cpu().numpy()"""
+        # 以uint8传到GPU（PCIe数据量为float32的1/4），在GPU上转换类型并归一化
+        gpu_code = f"""_to_cuda_pinned({image_var}){self._float_cast()}.div_(255.0)"""
+        if self.keep_on_gpu:
+            return f"({gpu_code})"
+        return self._host_code(gpu_code, match)
+    
+    def generate_gpu_resize_normalize_code(self, match) -> str:
+        """生成融合的GPU缩放+归一化代码：一次uint8上传，缩放和归一化都在GPU上完成"""
+        image_var = match.group(1).strip()
+        size_params = match.group(2).strip()
+        
+        # cv2.resize 的尺寸是 (宽, 高)，interpolate 需要 (高, 宽)
+        # HWC上的 permute/unsqueeze 都是视图：张量以channels_last布局进入 interpolate，全程没有布局转换拷贝
+        gpu_code = f"""torch.nn.functional.interpolate(
+    _to_cuda_pinned({image_var}).permute(2, 0, 1).unsqueeze(0){self._float_cast()},
+    size=({size_params})[::-1], mode='bilinear', align_corners=False
+).div_(255.0)"""
+        if self.keep_on_gpu:
+            # 直接给torch模型（YOLO卷积在channels_last下更快）使用；布局已是channels_last，这里只是显式保证
+            return f"{gpu_code}.contiguous(memory_format=torch.channels_last)"
+        return self._host_code(f"{gpu_code}.squeeze(0).permute(1, 2, 0)", match)
     
     def generate_gpu_zeros_code(self, match) -> str:
-        """生成GPU零数组创建代码"""
+        """生成GPU零数组代码：回传主机时复用预分配缓冲区原地清零，不再每帧分配显存"""
         shape_params = match.group(1).strip()
         
-        return f"""torch.zeros({shape_params}, dtype=torch.float32, device='cuda').cpu().numpy()"""
+        if self.keep_on_gpu:
+            # 结果以张量形式交给调用方保留，共享缓冲区会让各调用点的结果互相覆盖；
+            # 每次新建（缓存分配器复用已释放的块，不会走cudaMalloc）
+            return f"""torch.zeros({shape_params}, dtype=torch.float32, device='cuda')"""
+        
+        # 共享缓冲区只用在 _to_host 路径上：回传时拷贝到新的主机数组，调用方拿到的不是缓冲区本身
+        try:
+            ast.literal_eval(shape_params)
+            # 常量形状：按形状缓存的缓冲区在首次调用时分配，导入模块时不初始化CUDA
+            return f"_to_host(_zbuf({shape_params}))"
+        except (ValueError, SyntaxError):
+            hoist = getattr(match, 'hoist', None)
+            if hoist is None:
+                # 形状依赖运行时变量且不在循环内，无法预分配，保留逐次分配
+                return f"""torch.zeros({shape_params}, dtype=torch.float32, device='cuda').cpu().numpy()"""
+            # 形状与循环迭代无关：在最外层循环之前分配一次，循环内只原地清零
+            offset, indent = hoist
+            # 变量名取形状源码的稳定哈希（内置hash带随机盐，不同进程结果不同）
+            name = f"_zbuf_{hashlib.md5(shape_params.encode('utf-8')).hexdigest()[:8]}"
+            self._hoisted_allocs[(offset, name)] = (
+                f"{indent}{name} = torch.zeros({shape_params}, dtype=torch.float32, device='cuda')\n"
+            )
+        return f"_to_host({name}.zero_())"
     
     def generate_gpu_tensor_code(self, match) -> str:
-        """生成GPU张量转换代码"""
+        """生成GPU张量转换代码：大字面量直接经GPU，其余在运行时按元素数选择路径"""
         array_content = match.group(1).strip()
         
-        return f"""torch.tensor({array_content}, device='cuda').cpu().numpy()"""
+        if isinstance(ast.parse(array_content, mode='eval').body, (ast.List, ast.Tuple)):
+            return f"""torch.tensor({array_content}, device='cuda').cpu().numpy()"""
+        return f"""_gpu_array({array_content})"""
     
     def analyze_file_for_migration(self, file_path: str) -> Dict[str, List[Tuple]]:
         """分析文件中的迁移机会"""
         try:
+            if not self._may_contain_migrations(file_path):
+                return {}
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
         except Exception as e:
             print(f"[ERROR] 无法读取文件 {file_path}: {e}")
             return {}
         
-        opportunities = {}
+        return self._find_migrations(content)
+    
+    def _may_contain_migrations(self, file_path: str) -> bool:
+        """通过mmap零拷贝预筛选文件，绝大多数无迁移机会的文件到此即可跳过"""
+        if os.path.getsize(file_path) == 0:
+            return False
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return self.migration_prefilter.search(mm) is not None
+    
+    def _find_migrations(self, content: str) -> Dict[str, List[Tuple]]:
+        """
+        对源码做一次AST遍历，找出所有迁移机会
         
-        for migration_type, config in self.efficient_migrations.items():
-            pattern = config['pattern']
-            matches = list(re.finditer(pattern, content))
-            
-            if matches:
-                opportunities[migration_type] = [
-                    (match.start(), match.end(), match) for match in matches
-                ]
+        Returns:
+            {迁移类型: [(起始字节偏移, 结束字节偏移, _SourceMatch), ...]}
+        """
+        try:
+            tree = ast.parse(content)
+        except SyntaxError as e:
+            print(f"[WARNING] 无法解析源码: {e}")
+            return {}
         
-        return opportunities
+        # AST的列偏移是UTF-8字节偏移，统一在字节上定位
+        data = content.encode('utf-8')
+        line_starts = [0]
+        for line in data.splitlines(keepends=True):
+            line_starts.append(line_starts[-1] + len(line))
+        
+        def span(node) -> Tuple[int, int]:
+            return (line_starts[node.lineno - 1] + node.col_offset,
+                    line_starts[node.end_lineno - 1] + node.end_col_offset)
+        
+        def source(node) -> str:
+            start, end = span(node)
+            return data[start:end].decode('utf-8')
+        
+        # 变量名 → [(行号, 赋值表达式)]，供归一化迁移向上追溯数据类型
+        assignments = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign):
+                targets, value = node.targets, node.value
+            elif isinstance(node, ast.AnnAssign) and node.value is not None:
+                targets, value = [node.target], node.value
+            else:
+                continue
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    assignments.setdefault(target.id, []).append((node.lineno, value))
+        
+        def is_uint8_source(image, lineno: int) -> bool:
+            # 切片和 cv2.resize 都不改变数据类型，追溯到被切片/缩放的图像
+            while True:
+                if isinstance(image, ast.Subscript):
+                    image = image.value
+                elif _resize_args(image) is not None:
+                    image = _resize_args(image)[0]
+                else:
+                    break
+            if not isinstance(image, ast.Name):
+                return False
+            candidates = [(line, value) for line, value in assignments.get(image.id, [])
+                          if lineno - DTYPE_LOOKBACK_LINES <= line < lineno]
+            if not candidates:
+                return False
+            line, value = max(candidates, key=lambda item: item[0])
+            if _resize_args(value) is not None:
+                # 变量来自 cv2.resize：继续追溯被缩放图像在该赋值之前的来源
+                return is_uint8_source(value, line)
+            return _is_uint8_expr(value)
+        
+        opportunities = {}
+        loop_names = {}
+        # 栈元素为 (节点, 当前作用域内由外到内的外层循环, 是否每次迭代都必定执行)
+        # 后者只在节点位于最内层循环体的直接语句中、且各层循环都直接位于外层循环体中时成立
+        stack = [(tree, (), True)]
+        while stack:
+            node, loops, direct = stack.pop()
+            for migration_type, config in self.efficient_migrations.items():
+                groups = config['matcher'](node)
+                if groups is None:
+                    continue
+                if config.get('requires_uint8') and not is_uint8_source(groups[0], node.lineno):
+                    # 已是float32时上传没有带宽收益；int16等类型按uint8处理会改变语义
+                    print(f"  ⚠️  第{node.lineno}行的 {migration_type} 数据类型不确定，跳过以避免性能或语义回退")
+                    continue
+                hoist = None
+                if loops:
+                    # 循环内的迁移：参数随迭代变化时每次迭代都要新建GPU张量，比原CPU代码更慢
+                    stored = set().union(*(loop_names.setdefault(id(loop), _loop_stored_names(loop))
+                                           for loop in loops))
+                    if _is_loop_invariant(groups, stored):
+                        if direct:
+                            # 只外提每次迭代都必定执行的分配；分支或嵌套语句中的调用可能从不执行
+                            outer = loops[0]
+                            line_start = line_starts[outer.lineno - 1]
+                            hoist = (line_start, data[line_start:line_start + outer.col_offset].decode('utf-8'))
+                        elif config.get('needs_hoist_in_loop') and not _is_literal(groups[0]):
+                            print(f"  ⚠️  第{node.lineno}行的 {migration_type} 不一定每次迭代都执行，无法外提，跳过迁移")
+                            break
+                    elif not self.pipeline_loop_d2h:
+                        print(f"  ⚠️  第{node.lineno}行的 {migration_type} 位于循环内且参数随迭代变化，跳过迁移")
+                        break
+                start, end = span(node)
+                match = _SourceMatch(source(node), [source(group) for group in groups], hoist, bool(loops))
+                opportunities.setdefault(migration_type, []).append((start, end, match))
+                break
+            else:
+                if isinstance(node, _SCOPE_NODES):
+                    loops = ()
+                # 循环体的直接语句每次迭代都执行；外层已不是直接语句时内层循环体也不是
+                body_direct = direct or not loops
+                if isinstance(node, (ast.For, ast.AsyncFor)):
+                    # 迭代对象只求值一次、else 分支不在循环中
+                    stack.extend((child, loops, False) for child in (node.iter, *node.orelse))
+                    stack.extend((child, loops + (node,), body_direct) for child in (node.target, *node.body))
+                elif isinstance(node, ast.While):
+                    stack.extend((child, loops, False) for child in node.orelse)
+                    stack.extend((child, loops + (node,), body_direct) for child in (node.test, *node.body))
+                else:
+                    # 嵌套语句（if/try/with 等的子语句）不一定执行；表达式子节点随所在语句执行
+                    stack.extend((child, loops, direct and not isinstance(child, ast.stmt))
+                                 for child in ast.iter_child_nodes(node))
+        
+        # 按迁移类型的声明顺序、源码位置顺序返回
+        return {migration_type: sorted(opportunities[migration_type], key=lambda item: item[0])
+                for migration_type in self.efficient_migrations if migration_type in opportunities}
     
     def implement_file_migrations(self, file_path: str) -> Dict[str, any]:
         """实施文件中的迁移"""
         print(f"\n🔧 分析文件: {file_path}")
         
-        opportunities = self.analyze_file_for_migration(file_path)
-        
-        if not opportunities:
-            print(f"  ℹ️  未发现高效迁移机会")
-            return {'modified': False, 'migrations': 0}
-        
         try:
+            if not self._may_contain_migrations(file_path):
+                print(f"  ℹ️  未发现高效迁移机会")
+                return {'modified': False, 'migrations': 0}
             with open(file_path, 'r', encoding='utf-8') as f:
                 original_content = f.read()
         except Exception as e:
             print(f"[ERROR] 无法读取文件: {e}")
             return {'modified': False, 'migrations': 0, 'error': str(e)}
         
-        modified_content = original_content
+        self._hoisted_allocs = {}
+        self._pipeline_sites = 0
+        self._file_dtype = self.target_dtype or (
+            'float16' if self.half_model_pattern.search(original_content) else 'float32'
+        )
+        opportunities = self._find_migrations(original_content)
+        
+        if not opportunities:
+            print(f"  ℹ️  未发现高效迁移机会")
+            return {'modified': False, 'migrations': 0}
+        
+        edits = []
         total_migrations = 0
         migration_details = []
         
@@ -138,40 +775,47 @@ class GPUMigrationImplementer:
             
             # 只实施高效迁移（加速比 > 1.2x）
             if speedup >= 1.2:
-                pattern = config['pattern']
-                replacement_func = config['replacement']
+                # 生成函数是绑定方法，直接以匹配结果调用，不经额外的包装函数
+                generate = config['replacement']
+                edits.extend((start, end, generate(match)) for start, end, match in matches)
                 
-                def replace_match(match):
-                    return replacement_func(match)
+                migrations_applied = len(matches)
+                total_migrations += migrations_applied
                 
-                new_content = re.sub(pattern, replace_match, modified_content)
+                migration_details.append({
+                    'type': migration_type,
+                    'count': migrations_applied,
+                    'speedup': speedup,
+                    'priority': priority
+                })
                 
-                if new_content != modified_content:
-                    modified_content = new_content
-                    migrations_applied = len(matches)
-                    total_migrations += migrations_applied
-                    
-                    migration_details.append({
-                        'type': migration_type,
-                        'count': migrations_applied,
-                        'speedup': speedup,
-                        'priority': priority
-                    })
-                    
-                    print(f"    ✅ 应用了 {migrations_applied} 个迁移")
-                    self.performance_gains.append(speedup)
+                print(f"    ✅ 应用了 {migrations_applied} 个迁移")
+                self.performance_gains[speedup] += migrations_applied
             else:
                 print(f"    ⚠️  跳过低效迁移 (加速比: {speedup:.2f}x < 1.2x)")
         
+        # 循环不变的分配插入到最外层循环之前
+        for (offset, _), declaration in self._hoisted_allocs.items():
+            edits.append((offset, offset, declaration))
+        
+        # 各匹配互不重叠，从后往前替换，前面的偏移不受影响
+        data = original_content.encode('utf-8')
+        for start, end, code in sorted(edits, key=lambda edit: edit[0], reverse=True):
+            data = data[:start] + code.encode('utf-8') + data[end:]
+        modified_content = data.decode('utf-8')
+        
+        # 相邻迁移之间的结果直接以GPU张量传递，不再回传主机后又上传
+        modified_content, round_trips = _collapse_round_trips(modified_content)
+        if round_trips:
+            print(f"    ✅ 消除了 {round_trips} 次GPU↔主机往返")
+        
         # 保存修改后的文件
         if total_migrations > 0:
             # 添加必要的导入
             if 'import torch' not in modified_content:
                 # 在现有导入后添加torch导入
-                import_pattern = r'(import\s+\w+.*?\n)'
-                if re.search(import_pattern, modified_content):
-                    modified_content = re.sub(
-                        r'(import\s+numpy\s+as\s+np.*?\n)',
+                if self.any_import_pattern.search(modified_content):
+                    modified_content = self.numpy_import_pattern.sub(
                         r'\1import torch\nimport torch.nn.functional as F\n',
                         modified_content,
                         count=1
@@ -179,9 +823,32 @@ class GPUMigrationImplementer:
                 else:
                     modified_content = 'import torch\nimport torch.nn.functional as F\n' + modified_content
             
+            # 在 import torch 之后注入传输辅助函数、编译的缩放函数、数组转换函数和预分配零缓冲区（只注入一次）
+            injected = ''
+            if (('_to_cuda_pinned(' in modified_content or '_to_host(' in modified_content)
+                    and 'def _to_cuda_pinned' not in modified_content):
+                injected += PINNED_UPLOAD_HELPER
+            if '_to_host_pipelined(' in modified_content and 'def _to_host_pipelined' not in modified_content:
+                injected += PIPELINED_D2H_HELPER
+            if '_gpu_resize(' in modified_content and 'def _gpu_resize' not in modified_content:
+                injected += GPU_RESIZE_HELPER
+            if '_gpu_array(' in modified_content and 'def _gpu_array' not in modified_content:
+                injected += GPU_ARRAY_HELPER
+            if '_zbuf(' in modified_content and 'def _zbuf' not in modified_content:
+                injected += ZERO_BUFFER_HELPER
+            if injected:
+                modified_content = self.torch_import_pattern.sub(
+                    lambda m: m.group(1) + injected,
+                    modified_content,
+                    count=1
+                )
+            
+            # 先完整写入临时文件再原子替换，写入失败时原文件保持不变
+            tmp_file = file_path + '.tmp'
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
                     f.write(modified_content)
+                os.replace(tmp_file, file_path)
                 
                 self.migration_count += total_migrations
                 self.files_modified.append(file_path)
@@ -197,14 +864,14 @@ class GPUMigrationImplementer:
                 
             except Exception as e:
                 print(f"[ERROR] 保存文件失败: {e}")
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
                 return {'modified': False, 'migrations': 0, 'error': str(e)}
         
         return {'modified': False, 'migrations': 0}
     
     def find_target_files(self) -> List[str]:
         """查找目标文件"""
-        target_files = []
-        
         # 主要AI瞄准文件
         main_files = [
             'main_onnx.py',
@@ -216,15 +883,24 @@ class GPUMigrationImplementer:
             'performance_test.py'
         ]
         
-        for file_name in main_files:
-            file_path = Path(file_name)
-            if file_path.exists():
-                target_files.append(str(file_path.absolute()))
-        
-        # 查找其他Python文件
-        for py_file in Path('.').glob('*.py'):
-            if py_file.name not in main_files and py_file.stat().st_size > 1000:  # 大于1KB
-                target_files.append(str(py_file.absolute()))
+        main_file_set = set(main_files)
+        
+        # 一次 scandir 遍历当前目录：DirEntry 自带缓存的 stat 和文件名，无需逐个 stat/解析绝对路径
+        cwd = os.getcwd()
+        found_main = set()
+        other_files = []
+        with os.scandir(cwd) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.py') or not entry.is_file():
+                    continue
+                if entry.name in main_file_set:
+                    found_main.add(entry.name)
+                elif entry.stat().st_size > 1000:  # 大于1KB
+                    other_files.append(entry.path)
+        
+        # 主要文件按列表顺序排在前面，其余Python文件在后
+        target_files = [os.path.join(cwd, file_name) for file_name in main_files if file_name in found_main]
+        target_files.extend(other_files)
         
         print(f"[INFO] 🔍 发现 {len(target_files)} 个目标文件")
         return target_files
@@ -244,12 +920,20 @@ class GPUMigrationImplementer:
             return
         
         # 2. 实施迁移
+        # 各文件互相独立，用多进程并行处理；子进程中对实例状态的修改不会传回，统计在主进程中汇总
         migration_results = []
         
-        for file_path in target_files:
-            result = self.implement_file_migrations(file_path)
+        max_workers = min(os.cpu_count() or 1, len(target_files))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self.implement_file_migrations, target_files))
+        
+        for result in results:
             if result.get('modified', False):
                 migration_results.append(result)
+                self.migration_count += result['migrations']
+                self.files_modified.append(result['file_path'])
+                for detail in result['details']:
+                    self.performance_gains[detail['speedup']] += detail['count']
         
         # 3. 生成总结报告
         total_time = time.time() - start_time
@@ -261,20 +945,17 @@ class GPUMigrationImplementer:
         print(f"✅ 修改文件: {len(self.files_modified)} 个")
         print(f"🔄 总迁移数: {self.migration_count} 个")
         
+        avg_speedup = 1.0
         if self.performance_gains:
-            avg_speedup = sum(self.performance_gains) / len(self.performance_gains)
+            # 按迁移数加权：sum(数量 × 加速比) / sum(数量)
+            avg_speedup = (sum(speedup * count for speedup, count in self.performance_gains.items())
+                           / sum(self.performance_gains.values()))
             print(f"⚡ 平均加速比: {avg_speedup:.2f}x")
             print(f"🚀 预期性能提升: {(avg_speedup - 1) * 100:.1f}%")
         
-        # 4. 显示修改的文件
-        if self.files_modified:
-            print(f"\n📝 已修改的文件:")
-            for file_path in self.files_modified:
-                print(f"  • {Path(file_path).name}")
-        
-        # 5. 显示详细迁移统计
+        # 4. 显示修改的文件及其迁移详情
         if migration_results:
-            print(f"\n🎯 迁移详情:")
+            print(f"\n🎯 已修改的文件及迁移详情:")
             for result in migration_results:
                 file_name = Path(result['file_path']).name
                 migrations = result['migrations']
@@ -286,7 +967,7 @@ class GPUMigrationImplementer:
                     speedup = detail['speedup']
                     print(f"    • {migration_type}: {count} 个 ({speedup:.2f}x加速)")
         
-        # 6. 下一步建议
+        # 5. 下一步建议
         print(f"\n💡 下一步建议:")
         print(f"  1. 重启AI瞄准程序测试迁移效果")
         print(f"  2. 监控GPU利用率变化")
@@ -303,7 +984,7 @@ class GPUMigrationImplementer:
             'total_files': len(target_files),
             'modified_files': len(self.files_modified),
             'total_migrations': self.migration_count,
-            'average_speedup': avg_speedup if self.performance_gains else 1.0,
+            'average_speedup': avg_speedup,
             'results': migration_results
         }
 
@@ -1,10 +1,20 @@
 
 # GPU利用率监控脚本
-import time
+import sys
 import threading
 import psutil
 import os
 
+try:
+    from pynvml import (nvmlInit, nvmlDeviceGetHandleByIndex,
+                        nvmlDeviceGetUtilizationRates, nvmlDeviceGetMemoryInfo)
+    NVML_AVAILABLE = True
+except ImportError:
+    NVML_AVAILABLE = False
+
+# 系统内存变化缓慢，每隔这么多次采样才读取一次（psutil 需要解析 /proc/meminfo 等）
+PSUTIL_SAMPLE_EVERY = 6
+
 class GPUMonitor:
     """GPU监控器"""
     
@@ -20,9 +30,28 @@ class GPUMonitor:
         self.monitor_thread = None
         self.monitor_interval = monitor_interval
         self.enable_monitoring = enable_monitoring
+        # 停止信号：监控线程在此等待，stop_monitoring 时立即唤醒而不是睡满一个间隔
+        self._stop_event = threading.Event()
+        self._tick = 0
+        self._system_memory = None
+        
+        # NVML只初始化一次并缓存设备句柄，监控循环中不再重复解析
+        self._handle = None
+        if NVML_AVAILABLE:
+            try:
+                nvmlInit()
+                self._handle = nvmlDeviceGetHandleByIndex(0)
+            except Exception as e:
+                print(f"[WARNING] NVML初始化失败: {e}")
         
     def start_monitoring(self):
         """开始监控"""
+        if self._handle is None:
+            print("[WARNING] NVML不可用，GPU监控未启动")
+            return
+        if self.monitor_thread and self.monitor_thread.is_alive():
+            return
+        self._stop_event.clear()
         self.monitoring = True
         self.monitor_thread = threading.Thread(target=self._monitor_loop)
         self.monitor_thread.daemon = True
@@ -32,22 +61,22 @@ class GPUMonitor:
     def stop_monitoring(self):
         """停止监控"""
         self.monitoring = False
+        self._stop_event.set()
         if self.monitor_thread:
             self.monitor_thread.join()
+            self.monitor_thread = None
         print("[INFO] 🔍 GPU监控已停止")
     
     def _monitor_loop(self):
         """监控循环"""
-        while self.monitoring:
+        handle = self._handle
+        while not self._stop_event.is_set():
             try:
-                # 检查是否启用监控
-                if not self.enable_monitoring:
-                    time.sleep(self.monitor_interval)
+                # 检查是否启用监控；没有可输出的控制台（如 pythonw）时也不必采样和格式化
+                if not self.enable_monitoring or sys.stdout is None:
+                    self._stop_event.wait(self.monitor_interval)
                     continue
                 
-                # 获取GPU信息
-                handle = nvmlDeviceGetHandleByIndex(0)
-                
                 # GPU负载
                 utilization = nvmlDeviceGetUtilizationRates(handle)
                 gpu_load = utilization.gpu
@@ -58,8 +87,11 @@ class GPUMonitor:
                 memory_total_gb = memory_info.total / (1024**3)
                 memory_usage_percent = (memory_info.used / memory_info.total) * 100
                 
-                # 系统内存使用
-                memory = psutil.virtual_memory()
+                # 系统内存使用（降频读取）
+                if self._system_memory is None or self._tick % PSUTIL_SAMPLE_EVERY == 0:
+                    self._system_memory = psutil.virtual_memory()
+                self._tick += 1
+                memory = self._system_memory
                 system_memory_used_gb = memory.used / (1024**3)
                 system_memory_total_gb = memory.total / (1024**3)
                 system_memory_usage_percent = memory.percent
@@ -69,7 +101,7 @@ class GPUMonitor:
             except Exception as e:
                 print(f"[MONITOR] 监控错误: {e}")
             
-            time.sleep(self.monitor_interval)  # 使用可配置的监控间隔
+            self._stop_event.wait(self.monitor_interval)  # 使用可配置的监控间隔
 
 # 全局监控器
 _gpu_monitor = None
@@ -9,21 +9,72 @@ import time
 import os
 import sys
 import json
+import threading
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Any
 import psutil
 import GPUtil
 import torch
 
+try:
+    import pynvml
+    NVML_AVAILABLE = True
+except ImportError:
+    NVML_AVAILABLE = False
+
+# 保留的历史采样条数，超出后自动丢弃最旧的记录
+HISTORY_MAXLEN = 1000
+
+# 渲染线程检查是否有新采样的间隔（秒）
+RENDER_POLL_SECONDS = 0.1
+
 class GPURealtimeMonitor:
     """GPU实时监控器"""
     
     def __init__(self, monitor_interval: float = 2.0):
         self.monitor_interval = monitor_interval
         self.monitoring = False
-        self.data_history = []
+        self.data_history = deque(maxlen=HISTORY_MAXLEN)
         self.start_time = None
         
+        # 采样在后台线程进行：最新结果整体替换 _latest 引用（CPython中引用赋值是原子的），
+        # 渲染线程只读取该引用；历史记录的追加/裁剪与读取用锁保护
+        self._latest = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler_thread = None
+        
+        # NVML只初始化一次并缓存设备句柄和名称，每次采样直接查询驱动，不再经 GPUtil 调用 nvidia-smi
+        self._nvml_handles = []
+        self._gpu_names = []
+        if NVML_AVAILABLE:
+            try:
+                pynvml.nvmlInit()
+                for i in range(pynvml.nvmlDeviceGetCount()):
+                    handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+                    name = pynvml.nvmlDeviceGetName(handle)
+                    self._nvml_handles.append(handle)
+                    self._gpu_names.append(name.decode() if isinstance(name, bytes) else name)
+            except Exception as e:
+                print(f"[WARNING] NVML初始化失败，回退到GPUtil: {e}")
+                self._nvml_handles = []
+        
+        # cpu_percent(interval=None) 返回与上一次调用之间的使用率，这里先调用一次作为基准，采样时不再阻塞
+        psutil.cpu_percent(interval=None)
+        
+    def cleanup(self):
+        """释放NVML"""
+        if self._nvml_handles:
+            self._nvml_handles = []
+            try:
+                pynvml.nvmlShutdown()
+            except Exception:
+                pass
+    
+    def __del__(self):
+        self.cleanup()
+    
     def clear_screen(self):
         """清屏"""
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -35,11 +86,27 @@ class GPURealtimeMonitor:
             'gpu_available': torch.cuda.is_available(),
             'gpu_info': [],
             'system_memory': {},
-            'cpu_usage': psutil.cpu_percent(interval=0.1)
+            'cpu_usage': psutil.cpu_percent(interval=None)
         }
         
-        # GPU信息
-        if torch.cuda.is_available():
+        # GPU信息（显存单位与GPUtil一致，为MB）
+        if self._nvml_handles:
+            try:
+                for i, handle in enumerate(self._nvml_handles):
+                    utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
+                    memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                    stats['gpu_info'].append({
+                        'id': i,
+                        'name': self._gpu_names[i],
+                        'utilization': float(utilization.gpu),
+                        'memory_used': memory_info.used / 1024**2,
+                        'memory_total': memory_info.total / 1024**2,
+                        'memory_util': memory_info.used / memory_info.total * 100,
+                        'temperature': pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+                    })
+            except Exception as e:
+                stats['gpu_error'] = str(e)
+        elif torch.cuda.is_available():
             try:
                 gpus = GPUtil.getGPUs()
                 for i, gpu in enumerate(gpus):
@@ -86,11 +153,12 @@ class GPURealtimeMonitor:
     
     def calculate_trends(self) -> Dict[str, str]:
         """计算趋势"""
-        if len(self.data_history) < 2:
-            return {}
+        with self._lock:
+            if len(self.data_history) < 2:
+                return {}
+            current = self.data_history[-1]
+            previous = self.data_history[-2]
         
-        current = self.data_history[-1]
-        previous = self.data_history[-2]
         trends = {}
         
         if current['gpu_info'] and previous['gpu_info']:
@@ -228,11 +296,32 @@ class GPURealtimeMonitor:
         
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.data_history, f, indent=2, ensure_ascii=False)
+                json.dump(list(self.data_history), f, indent=2, ensure_ascii=False)
             print(f"\n💾 监控数据已保存到: {filename}")
         except Exception as e:
             print(f"\n❌ 数据保存失败: {e}")
     
+    def _sampler_loop(self):
+        """后台采样循环：按固定节拍采样，渲染耗时不影响采样间隔"""
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            stats = self.get_system_stats()
+            with self._lock:
+                self.data_history.append(stats)
+            self._latest = stats
+            
+            # 以绝对时间计算下次采样时刻，避免采样本身的耗时累积成漂移
+            next_tick += self.monitor_interval
+            self._stop_event.wait(max(0.0, next_tick - time.monotonic()))
+    
+    def _stop_sampler(self):
+        """停止后台采样线程"""
+        self.monitoring = False
+        self._stop_event.set()
+        if self._sampler_thread:
+            self._sampler_thread.join()
+            self._sampler_thread = None
+    
     def start_monitoring(self):
         """开始监控"""
         print("🚀 启动GPU实时监控...")
@@ -241,26 +330,24 @@ class GPURealtimeMonitor:
         
         self.monitoring = True
         self.start_time = time.time()
+        self._stop_event.clear()
+        self._sampler_thread = threading.Thread(target=self._sampler_loop, daemon=True)
+        self._sampler_thread.start()
         
         try:
+            rendered = None
             while self.monitoring:
-                # 获取系统状态
-                stats = self.get_system_stats()
-                self.data_history.append(stats)
+                # 只在有新采样时重绘界面
+                stats = self._latest
+                if stats is not None and stats is not rendered:
+                    self.display_monitor_screen(stats)
+                    rendered = stats
                 
-                # 限制历史数据长度
-                if len(self.data_history) > 1000:
-                    self.data_history = self.data_history[-500:]
-                
-                # 显示监控界面
-                self.display_monitor_screen(stats)
-                
-                # 等待下次更新
-                time.sleep(self.monitor_interval)
+                time.sleep(RENDER_POLL_SECONDS)
                 
         except KeyboardInterrupt:
             print("\n\n⏹️ 监控已停止")
-            self.monitoring = False
+            self._stop_sampler()
             
             # 保存数据
             if len(self.data_history) > 10:
@@ -272,7 +359,10 @@ class GPURealtimeMonitor:
         
         except Exception as e:
             print(f"\n❌ 监控异常: {e}")
-            self.monitoring = False
+        
+        finally:
+            self._stop_sampler()
+            self.cleanup()
 
 def main():
     """主函数"""
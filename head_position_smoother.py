@@ -3,7 +3,7 @@
 专门用于减少头部位置计算中的抖动和不稳定性
 """
 
-import numpy as np
+import math
 from collections import deque
 from typing import Tuple, Optional
 import time
@@ -53,6 +53,29 @@ class HeadPositionSmoother:
         print(f"   • 速度平滑: {velocity_smoothing}")
         print(f"   • 移动阈值: {min_movement_threshold}")
     
+    @property
+    def smoothing_factor(self) -> float:
+        return self._smoothing_factor
+    
+    @smoothing_factor.setter
+    def smoothing_factor(self, value: float):
+        # 赋值时预先算好三档（正常/快速/慢速）平滑系数及其 1-alpha，每帧更新时直接取用
+        self._smoothing_factor = value
+        self._alpha_normal = (value, 1.0 - value)
+        fast = value * 0.7  # 快速移动时减少平滑
+        self._alpha_fast = (fast, 1.0 - fast)
+        slow = min(value * 1.2, 0.9)  # 慢速移动时增加平滑，限制最大平滑系数
+        self._alpha_slow = (slow, 1.0 - slow)
+    
+    @property
+    def velocity_smoothing(self) -> float:
+        return self._velocity_smoothing
+    
+    @velocity_smoothing.setter
+    def velocity_smoothing(self, value: float):
+        self._velocity_smoothing = value
+        self._vel_one_minus = 1.0 - value
+    
     def update_position(self, head_x: float, head_y: float) -> Tuple[float, float]:
         """
         更新头部位置并返回平滑后的位置
@@ -74,9 +97,8 @@ class HeadPositionSmoother:
             self._add_to_history(head_x, head_y, current_time)
             return head_x, head_y
         
-        # 计算与当前平滑位置的距离
-        distance = np.sqrt((head_x - self.current_smoothed_x)**2 + 
-                          (head_y - self.current_smoothed_y)**2)
+        # 计算与当前平滑位置的距离（标量运算用 math，避免numpy的调用开销）
+        distance = math.hypot(head_x - self.current_smoothed_x, head_y - self.current_smoothed_y)
         
         # 如果移动距离太小，保持当前位置
         if distance < self.min_movement_threshold:
@@ -90,25 +112,23 @@ class HeadPositionSmoother:
                 new_velocity_y = (head_y - self.position_history[-1][1]) / dt
                 
                 # 平滑速度
-                self.velocity_x = (1 - self.velocity_smoothing) * self.velocity_x + \
-                                 self.velocity_smoothing * new_velocity_x
-                self.velocity_y = (1 - self.velocity_smoothing) * self.velocity_y + \
-                                 self.velocity_smoothing * new_velocity_y
-        
-        # 应用位置平滑
-        alpha = self.smoothing_factor
+                self.velocity_x = self._vel_one_minus * self.velocity_x + \
+                                 self._velocity_smoothing * new_velocity_x
+                self.velocity_y = self._vel_one_minus * self.velocity_y + \
+                                 self._velocity_smoothing * new_velocity_y
         
-        # 基于速度调整平滑系数
-        speed = np.sqrt(self.velocity_x**2 + self.velocity_y**2)
+        # 基于速度选择平滑系数
+        speed = math.hypot(self.velocity_x, self.velocity_y)
         if speed > 100:  # 快速移动时减少平滑
-            alpha *= 0.7
+            alpha, one_minus_alpha = self._alpha_fast
         elif speed < 10:  # 慢速移动时增加平滑
-            alpha *= 1.2
-            alpha = min(alpha, 0.9)  # 限制最大平滑系数
+            alpha, one_minus_alpha = self._alpha_slow
+        else:
+            alpha, one_minus_alpha = self._alpha_normal
         
         # 计算平滑位置
-        self.current_smoothed_x = (1 - alpha) * self.current_smoothed_x + alpha * head_x
-        self.current_smoothed_y = (1 - alpha) * self.current_smoothed_y + alpha * head_y
+        self.current_smoothed_x = one_minus_alpha * self.current_smoothed_x + alpha * head_x
+        self.current_smoothed_y = one_minus_alpha * self.current_smoothed_y + alpha * head_y
         
         # 添加到历史记录
         self._add_to_history(head_x, head_y, current_time)
@@ -151,9 +171,9 @@ class HeadPositionSmoother:
         if len(self.position_history) == 0:
             return None
         
-        positions = np.array(self.position_history)
-        avg_x = np.mean(positions[:, 0])
-        avg_y = np.mean(positions[:, 1])
+        count = len(self.position_history)
+        avg_x = sum(x for x, _ in self.position_history) / count
+        avg_y = sum(y for _, y in self.position_history) / count
         
         return avg_x, avg_y
     
@@ -175,7 +195,7 @@ class HeadPositionSmoother:
             'total_updates': self.total_updates,
             'smoothed_updates': self.smoothed_updates,
             'smoothing_rate': smoothing_rate,
-            'current_velocity': np.sqrt(self.velocity_x**2 + self.velocity_y**2),
+            'current_velocity': math.hypot(self.velocity_x, self.velocity_y),
             'history_size': len(self.position_history),
             'current_position': (self.current_smoothed_x, self.current_smoothed_y) if self.current_smoothed_x is not None else None
         }
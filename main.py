@@ -1,3 +1,7 @@
+# 在任何模块导入torch、初始化CUDA之前应用保存的CUDA分配器配置
+from unified_memory_config import apply_saved_allocator_conf
+apply_saved_allocator_conf()
+
 import onnxruntime as ort
 import numpy as np
 import gc
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一内存配置读取
+GPU内存最大化配置器 / GPU重度模式增强器把配置写入 gui_config.json 的 "unified_memory" 段，
+主程序启动时在这里读取；本模块不导入torch，可以在CUDA初始化之前调用
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+CONFIG_FILE = "gui_config.json"
+
+# PyTorch CUDA缓存分配器配置：可扩展段避免碎片 + 限制大块拆分 + 提前回收缓存
+# GPU内存最大化配置器和GPU重度模式增强器都写入这一个值，避免生效配置取决于最后运行的工具
+ALLOCATOR_CONF = "expandable_segments:True,max_split_size_mb:512,garbage_collection_threshold:0.8"
+
+def load_unified_memory_config(config_file: str = CONFIG_FILE) -> Dict[str, Any]:
+    """读取 gui_config.json 中的 "unified_memory" 段，文件不存在或无法解析时返回空字典"""
+    if not os.path.exists(config_file):
+        return {}
+    try:
+        with open(config_file, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except Exception as e:
+        print(f"[WARNING] 读取统一内存配置失败: {e}")
+        return {}
+    unified_memory = config.get("unified_memory")
+    return unified_memory if isinstance(unified_memory, dict) else {}
+
+def apply_saved_allocator_conf(config_file: str = CONFIG_FILE) -> Optional[str]:
+    """
+    把保存的 allocator_conf 设置为 PYTORCH_CUDA_ALLOC_CONF
+
+    必须在torch初始化CUDA之前调用才会生效；用户已设置该环境变量时不覆盖
+
+    Returns:
+        实际生效的分配器配置，没有配置时返回None
+    """
+    allocator_conf = load_unified_memory_config(config_file).get("allocator_conf")
+    if allocator_conf and "PYTORCH_CUDA_ALLOC_CONF" not in os.environ:
+        os.environ["PYTORCH_CUDA_ALLOC_CONF"] = allocator_conf
+        print(f"[INFO] CUDA分配器配置: {allocator_conf}")
+    return os.environ.get("PYTORCH_CUDA_ALLOC_CONF")
+
+def get_memory_limit_gb(config_file: str = CONFIG_FILE) -> Optional[float]:
+    """
+    保存的本进程显存上限（GB），未配置时返回None
+
+    只读取专用的 memory_limit_gb 键；unified_memory_size_gb 是内存池大小，不能当作进程上限
+    """
+    limit_gb = load_unified_memory_config(config_file).get("memory_limit_gb")
+    return float(limit_gb) if isinstance(limit_gb, (int, float)) and limit_gb > 0 else None